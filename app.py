@@ -1,70 +1,132 @@
+import argparse
+import json
 import os
+import socket
+import threading
 import time
-from callapi import generate_audio_by_prompt, get_audio_information
-from openaiapi import generate_image, save_image, generate_video_title, generate_video_description, extend_cover_image, edit_cover_description, edit_description
-from moviepy.editor import AudioFileClip, ImageClip
-from downloadsong import download_mp3
-from pydub import AudioSegment
+from callapi import get_audio_information
+from openaiapi import cache as openai_cache, album_metadata, generate_image_variants, extend_cover_image, edit_cover_description, edit_description
+from downloadsong import download_many
 from uploadtoyoutube import get_authenticated_service, upload_video
-import shutil
-from datetime import datetime
-
-# Create necessary directories
-os.makedirs("songs", exist_ok=True)
-os.makedirs("covers", exist_ok=True)
-os.makedirs("video", exist_ok=True)
-os.makedirs("audio", exist_ok=True)
-
-def generate_song(description):
-    # Generate audio based on the description
-    data = generate_audio_by_prompt({
-        "prompt": description,
-        "make_instrumental": True,
-        "wait_audio": False
-    })
-    
-    # Check if the API returned the expected structure
-    if not data or len(data) < 2:
-        raise ValueError("The API did not return two songs as expected.")
-
-    # Extract song IDs for the two generated songs
-    ids = f"{data[0]['id']},{data[1]['id']}"
+from songscheduler import clip_ready, iter_songs, submit_batch
+from audiotools import AlbumEncoder, probe_duration
+from videoencoder import encode_still_video
+from pcmstore import PcmStore
+from pipeline import checked_samples, decoded_samples, combine_files, mix_stream, format_timestamps
+from polling import Deadline, PollMetrics, default_strategy
+from jobs import AlbumJob, JobCancelled, unfinished_jobs
+from workerpool import StageLimits, run_albums
+from uploadqueue import UploadQueue
+from ratelimit import quota_status, suno_quota, SUNO_CREDITS_PER_BATCH
+from tracing import add_listener, count, propagate, remove_listener, stage
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Used for anything not given on the command line or in the config file
+DEFAULT_SETTINGS = {
+    "description": "lofi chill retro arcade",
+    "cover_description": "tiltshift, miniture diorama, student study room, cozy, warm, low light",
+    "iterations": 9,
+    "albums": 1,
+    "parallel_albums": 1,
+    "resume": True,
+    "background_uploads": True,
+    "combined_metadata": True,
+    "tags": ["lofi", "jazz", "study"],
+    "privacy": "public",
+    "queue": "album_queue.db",
+    "suno_submissions_per_minute": None,
+    "suno_burst": 1,
+}
+
+# Cover variants requested per image call, and how many calls to make before settling for a near-duplicate
+COVER_VARIANTS = 4
+COVER_ROUNDS = 2
+
+# Perceptual hashes of past covers; created on first use, since it needs NumPy
+_cover_index = None
+
+def get_cover_index():
+    global _cover_index
+    if _cover_index is None:
+        from coverhash import CoverIndex
+        _cover_index = CoverIndex()
+    return _cover_index
+
+@stage('generate_song')
+def generate_song(description, strategy=None, deadline=None, songs_dir="songs", on_submit=None):
+    # Generate audio based on the description, within the Suno quota
+    clip_ids = submit_batch(description)
+    ids = ",".join(clip_ids)
     print(f"Generated song IDs: {ids}")
+    # Let the caller record the clips before the long wait, so a crash doesn't regenerate them
+    if on_submit:
+        on_submit(clip_ids)
 
-    # Initialize paths for the audio files to be downloaded
-    audio_files = []
-    max_attempts = 300  # Number of retries for checking the streaming status
+    strategy = strategy or default_strategy()
+    deadline = deadline or Deadline(25 * 60)
+    submitted_at = time.monotonic()
 
     # Wait until the songs are ready for streaming
-    for attempt in range(max_attempts):
+    attempt = 0
+    while not deadline.expired():
         data = get_audio_information(ids)
-
-        # Check if both songs are ready for streaming
-        if all(song.get("status") == 'streaming' for song in data[:2]):
-            for song in data[:2]:
-                audio_url = song['audio_url']
-                output_path = f"songs/{song['id']}_song.mp3"
-                download_mp3(audio_url, output_path)
-                audio_files.append(output_path)
+        count('polls')
+
+        # Check if both songs are ready for streaming (or already complete)
+        if all(clip_ready(song) for song in data[:2]):
+            strategy.record(time.monotonic() - submitted_at)
+            # Download both songs at once; any failure is raised as a DownloadError
+            audio_files, errors = download_many(
+                [(song['audio_url'], os.path.join(songs_dir, f"{song['id']}_song.mp3")) for song in data[:2]]
+            )
+            if errors:
+                raise errors[0]
 
             print("Songs downloaded.")
             return audio_files  # Return list of downloaded song paths
 
-        # Wait for a few seconds before trying again
-        time.sleep(5)
+        # Wait as long as the polling strategy suggests before trying again
+        delay = strategy.next_delay(time.monotonic() - submitted_at, attempt)
+        time.sleep(min(delay, max(deadline.remaining(), 0)))
+        attempt += 1
     
     # If songs are not ready within the time limit, raise an exception
     raise Exception("Audio generation timed out.")
 
-def create_cover_image(description):
-    # Generate a cover image
-    image_url = generate_image(description)
-    cover_path = "covers/cover_image.png"
-    save_image(image_url, cover_path)
-    print("Cover image created.")
+def create_cover_image(description, cover_path="covers/cover_image.png", variants=COVER_VARIANTS,
+                       rounds=COVER_ROUNDS, job_id=None, image_prompt=None):
+    from coverhash import DUPLICATE_DISTANCE, perceptual_hashes
+    index = get_cover_index()
+    for attempt in range(rounds):
+        # Generate several variants in one call (reused from the cache if this prompt was already generated)
+        # A retry must not be answered from the cache with the images just rejected
+        images = generate_image_variants(description, n=variants, refined_prompt=image_prompt, fresh=attempt > 0)
+        hashes = perceptual_hashes(images)
+        best, distance = index.pick(hashes)
+        if distance > DUPLICATE_DISTANCE or attempt == rounds - 1:
+            break
+        # Every variant looks like a recent cover; try again with a changed description
+        print(f"All {len(images)} cover variants are within {distance} bits of a recent cover, retrying...")
+        description = edit_cover_description(description, fresh=True) or description
+        image_prompt = None
+
+    with open(cover_path, 'wb') as file:
+        file.write(images[best])
+    index.add(hashes[best], job=job_id, path=cover_path, distance=distance, prompt=description)
+    print(f"Cover image created (variant {best + 1} of {len(images)}, {distance} bits from the closest recent cover).")
     return cover_path
 
-def create_video(audio_path, cover_path, output_path):
+def create_video(audio_path, cover_path, output_path, still=True, preset='balanced'):
+    if still:
+        # Loop a short pre-encoded clip of the cover and copy the album audio in unchanged
+        encode_still_video(cover_path, audio_path, output_path, preset=preset)
+        print(f"Video saved to {output_path}")
+        return
+
+    # MoviePy is slow to import, so it is only loaded for this path
+    from moviepy.editor import AudioFileClip, ImageClip
+
     # Load the audio and image
     audio_clip = AudioFileClip(audio_path)
     image_clip = ImageClip(cover_path)
@@ -77,148 +139,512 @@ def create_video(audio_path, cover_path, output_path):
     image_clip.write_videofile(output_path, codec="libx264", fps=24)
     print(f"Video saved to {output_path}")
 
-def combine_songs(audio_files, fade_duration=1000):
-    combined_audio = AudioSegment.empty()
-    timestamps = []
-    current_time = 0
-
-    for audio_file in audio_files:
-        song = AudioSegment.from_file(audio_file)
-
-        # Apply fade out only
-        faded_song = song.fade_out(fade_duration)
-
-        combined_audio += faded_song
-        timestamps.append(current_time)
-        current_time += len(faded_song) / 1000  # Convert milliseconds to seconds
-
-    # Save the combined audio
-    combined_audio_path = "audio/combined_audio_with_fade_out.mp3"
-    combined_audio.export(combined_audio_path, format="mp3")
-    
-    return combined_audio_path, timestamps
-
-def clear_folder(folder_path):
-    """Delete all files in the specified folder."""
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        try:
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-        except Exception as e:
-            print(f"Failed to delete {file_path}. Reason: {e}")
+def combine_songs(audio_files, fade_duration=1000, combined_audio_path="audio/combined_audio_with_fade_out.m4a",
+                  crossfade_duration=0, store=None):
+    from audioengine import AlbumMixer
+
+    # Songs are decoded to memory-mapped scratch files, then checked, normalized, faded and
+    # streamed into one encoder a chunk at a time
+    temporary = store is None
+    store = store or PcmStore()
+    try:
+        with AlbumEncoder(combined_audio_path) as encoder:
+            mixer = AlbumMixer(encoder, fade_out=fade_duration, crossfade=crossfade_duration)
+            for _, samples in checked_samples((audio_file, store.decode(audio_file)) for audio_file in audio_files):
+                mixer.add(samples)
+
+            # Save the combined audio
+            return mixer.finish()
+    finally:
+        if temporary:
+            store.clear()
 
 def filter_short_songs(audio_files, min_duration=30):
     """Filter out audio files under a specified minimum duration (in seconds)."""
     valid_audio_files = []
     for file in audio_files:
-        audio = AudioSegment.from_file(file)
-        duration_seconds = len(audio) / 1000  # pydub returns duration in milliseconds
+        # Read the duration from the file headers instead of decoding the whole song
+        duration_seconds = probe_duration(file)
         if duration_seconds >= min_duration:
             valid_audio_files.append(file)
     return valid_audio_files
 
-def main_loop(description, cover_description, num_songs):
-
-    # Define folder paths
-    folders_to_clear = ['audio', 'covers', 'songs']
-
-    # Clear each folder
-    for folder in folders_to_clear:
-        clear_folder(folder)
-
-    # Create the cover image using the separate cover description
-    cover_path = create_cover_image(cover_description)
-
-    # Extend the cover image
-    cover_path = extend_cover_image(cover_path)
-
-    # Generate songs in separate calls, each call returns 2 songs
-    audio_files = []
-    for _ in range(num_songs):  # Repeat to get songs
-        audio_files.extend(generate_song(description))
-    
-    # Filter out songs under 30 seconds
-    audio_files = filter_short_songs(audio_files, min_duration=30)
-
-    # Combine all audio files into a single file and get timestamps
-    combined_audio_path, timestamps_in_seconds = combine_songs(audio_files)
-    timestamps_in_minutes = []
-    for timestamp in timestamps_in_seconds:
-        minutes = int(timestamp // 60)
-        seconds = int(timestamp % 60)
-        timestamps_in_minutes.append(f"{minutes:02}:{seconds:02}")
-
-    # Create a single video from the combined audio and cover image
-    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-    video_filename = f"combined_video_{current_time}.mp4"
-    output_path = f"video/{video_filename}"
-    create_video(combined_audio_path, cover_path, output_path)
-
-    # Print or return the timestamps for each song
-    print("Timestamps for each song in the combined file:", timestamps_in_minutes)
-
-    # Generate the title, description, and tags for the video
-    video_title = generate_video_title(description, cover_description)
-    video_description = generate_video_description(description, video_title, timestamps_in_minutes)
-
-    # Print the generated information
-    print(f"Generated Video Title: {video_title}")
-    print(f"Generated Video Description: {video_description}")
-
-    text_filename = video_filename.replace('.mp4', '.txt')
-    text_output_path = f"video/{text_filename}"
-
-    # Write the video title and description into the text file
-    with open(text_output_path, 'w', encoding='utf-8') as file:
-        file.write(f"{video_title}\n\n{video_description}")
-
-    # YouTube upload section
-    youtube = get_authenticated_service()
-    title = video_title
-    description = video_description
-    category = '10'  # Music Category
-    tags = ['lofi', 'jazz', 'study']
-
-    # Upload video to YouTube
-    upload_video(youtube, output_path, title, description, category, tags)
-
-def main():
+def _limited(limits, kind, func, *args):
+    # Without StageLimits the stage runs directly; otherwise it waits for a slot of its kind
+    if limits is None:
+        return func(*args)
+    return limits.run(kind, func, *args)
+
+def _submit(executor, func, *args):
+    # Without an executor the stage simply runs now, in order
+    if executor is None:
+        future = Future()
+        future.set_result(func(*args))
+        return future
+    # Stages on the executor still report to the album's trace
+    return executor.submit(propagate(func), *args)
+
+def album_songs(job, description, num_songs, concurrent, strategy, deadline, on_generated=None):
+    """
+    Yield the album's song paths, starting with any the job already downloaded. In
+    concurrent mode on_generated() is called once the server has finished every clip.
+    """
+    yield from job.downloaded_clips()
+
+    # Clips submitted before an interrupted run are polled again rather than regenerated
+    resume_clips = job.pending_clips()
+    first_batch = job.batches_submitted()
+    if concurrent:
+        # Submit every batch up front and poll them together
+        yield from iter_songs(description, num_songs - first_batch, strategy=strategy, deadline=deadline,
+                              metrics=PollMetrics(), songs_dir=job.path('songs'), resume_clips=resume_clips,
+                              first_batch=first_batch, on_submit=job.record_submitted,
+                              on_download=job.record_downloaded, on_generated=on_generated)
+    else:
+        if resume_clips:
+            yield from iter_songs(description, 0, strategy=strategy, deadline=deadline,
+                                  songs_dir=job.path('songs'), resume_clips=resume_clips,
+                                  on_download=job.record_downloaded)
+        for batch in range(first_batch, num_songs):  # Repeat to get songs
+            for audio_file in generate_song(description, strategy=strategy, deadline=deadline,
+                                            songs_dir=job.path('songs'),
+                                            on_submit=partial(job.record_submitted, batch=batch)):
+                clip_id = os.path.basename(audio_file).replace('_song.mp3', '')
+                job.record_downloaded(clip_id, audio_file)
+                yield audio_file
+
+def cover_stage(job, cover_description, limits=None):
+    outputs = job.stage('cover')
+    if outputs is None:
+        # Create the cover image using the separate cover description, then extend it
+        with stage('cover'):
+            cover_path = _limited(limits, 'openai', create_cover_image, cover_description,
+                                  job.path('covers', 'cover_image.png'), COVER_VARIANTS, COVER_ROUNDS, job.id,
+                                  job.params.get('image_prompt'))
+        with stage('extend_cover'):
+            cover_path = _limited(limits, 'openai', extend_cover_image, cover_path)
+        outputs = job.complete('cover', {'cover_path': cover_path}, [cover_path])
+    return outputs['cover_path']
+
+def metadata_stage(job, description, cover_description, timestamps_in_minutes, combined=True, limits=None):
+    # Title, description and the next album's prompts; see openaiapi.album_metadata
+    outputs = job.stage('metadata')
+    if outputs is None:
+        with stage('metadata', combined=combined):
+            metadata = _limited(limits, 'openai', album_metadata, description, cover_description,
+                                timestamps_in_minutes, combined)
+        outputs = job.complete('metadata', metadata)
+    return outputs
+
+def combine_stage(job, description, num_songs, concurrent, streaming, strategy, deadline, limits=None):
+    outputs = job.stage('combine')
+    if outputs is None:
+        combined_audio_path = job.path('audio', 'combined_audio_with_fade_out.m4a')
+        songs = partial(album_songs, job, description, num_songs, concurrent, strategy, deadline)
+        # Songs are decoded once into the job's PCM scratch store; a resumed combine reuses them
+        store = PcmStore(job.path('pcm'))
+        if limits is not None:
+            # With a shared pool, an album holds a Suno slot only while its clips are submitted and
+            # polled, and the combine runs in the CPU pool once every song is downloaded. Streaming's
+            # overlap of downloads and decoding is deliberately given up, so that albums share the
+            # cores through the pool instead of each decoding on its own thread.
+            with stage('songs'), limits.held('suno') as release:
+                audio_files = list(songs(on_generated=release))
+            with stage('combine'):
+                combined_audio_path, timestamps = limits.run('cpu', combine_files, audio_files,
+                                                             combined_audio_path, 30, 1000, 0, store.directory)
+        elif streaming:
+            # Each song is decoded, checked, normalized and faded as soon as it is downloaded
+            with stage('songs_and_combine'):
+                checked = checked_samples(decoded_samples(songs(), min_duration=30, store=store), min_duration=30)
+                combined_audio_path, timestamps = mix_stream(checked, combined_audio_path)
+        else:
+            # Filter out songs under 30 seconds, then combine them all at once
+            with stage('songs'):
+                audio_files = filter_short_songs(list(songs()), min_duration=30)
+            with stage('combine'):
+                combined_audio_path, timestamps = combine_songs(audio_files,
+                                                                combined_audio_path=combined_audio_path,
+                                                                store=store)
+        outputs = job.complete('combine', {'audio_path': combined_audio_path, 'timestamps': timestamps},
+                               [combined_audio_path])
+        # The scratch PCM is about 10 MB a minute; it isn't needed once the album audio exists
+        store.clear()
+    return outputs['audio_path'], outputs['timestamps']
+
+def video_stage(job, combined_audio_path, cover_path, limits=None):
+    outputs = job.stage('video')
+    if outputs is None:
+        output_path = job.path('video', f"combined_video_{job.id}.mp4")
+        with stage('video'):
+            _limited(limits, 'cpu', create_video, combined_audio_path, cover_path, output_path)
+        outputs = job.complete('video', {'video_path': output_path}, [output_path])
+    return outputs['video_path']
+
+def main_loop(description, cover_description, num_songs, concurrent=True, streaming=True, album_timeout=60 * 60,
+              job=None, limits=None, upload_queue=None, combined_metadata=True, image_prompt=None, tags=None,
+              privacy='public'):
+    """
+    Produce one album. Returns the album's metadata, whose next_description,
+    next_cover_description and next_image_prompt (None unless combined_metadata
+    succeeded) can seed the next album; image_prompt skips refining the cover prompt.
+    """
+    # Every album works in its own job directory; pass an unfinished job to resume it
+    if job is None:
+        job = AlbumJob.create({"description": description, "cover_description": cover_description,
+                               "num_songs": num_songs, "image_prompt": image_prompt})
+    print(f"Working on album job {job.id} in {job.job_dir}")
+
+    # Every stage of the album is traced under its job id
+    with stage('album', job=job.id):
+        # Pause before starting if the Suno credits can't cover the rest of the album
+        if job.stage('combine') is None:
+            suno_quota.wait_for((num_songs - job.batches_submitted()) * SUNO_CREDITS_PER_BATCH,
+                                timeout=album_timeout)
+
+        # Generate songs, each call returns 2 songs. One deadline covers the whole album.
+        strategy = default_strategy()
+        deadline = Deadline(album_timeout)
+
+        # In streaming mode the cover and metadata run alongside the audio work
+        executor = ThreadPoolExecutor(max_workers=3) if streaming else None
+        try:
+            cover_future = _submit(executor, cover_stage, job, cover_description, limits)
+
+            combined_audio_path, timestamps_in_seconds = combine_stage(job, description, num_songs, concurrent,
+                                                                       streaming, strategy, deadline, limits)
+            timestamps_in_minutes = format_timestamps(timestamps_in_seconds)
+            print("Timestamps for each song in the combined file:", timestamps_in_minutes)
+
+            # The metadata needs the timestamps, but can be written while the video encodes
+            metadata_future = _submit(executor, metadata_stage, job, description, cover_description,
+                                      timestamps_in_minutes, combined_metadata, limits)
+
+            # Create a single video from the combined audio and cover image
+            output_path = video_stage(job, combined_audio_path, cover_future.result(), limits)
+            metadata = metadata_future.result()
+            video_title, video_description = metadata['title'], metadata['description']
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Print the generated information
+        print(f"Generated Video Title: {video_title}")
+        print(f"Generated Video Description: {video_description}")
+        print(f"OpenAI cache: {openai_cache.stats()}")
+        print(f"Quota: {quota_status()}")
+
+        text_output_path = output_path.replace('.mp4', '.txt')
+
+        # Write the video title and description into the text file
+        with open(text_output_path, 'w', encoding='utf-8') as file:
+            file.write(f"{video_title}\n\n{video_description}")
+
+        if job.stage('upload') is None:
+            # YouTube upload section
+            title = video_title
+            description = video_description
+            category = '10'  # Music Category
+            tags = DEFAULT_SETTINGS["tags"] if tags is None else tags
+
+            if upload_queue is not None:
+                # Upload in the background; the queue finishes the job once the video is up
+                upload_queue.put(output_path, title, description, category, tags, privacy, job_dir=job.job_dir)
+                return metadata
+
+            # Upload video to YouTube
+            youtube = get_authenticated_service()
+            with stage('upload'):
+                response = _limited(limits, 'youtube', partial(upload_video, privacy=privacy), youtube,
+                                    output_path, title, description, category, tags)
+            job.complete('upload', {'video_id': response.get('id')})
+
+        job.finish()
+        return metadata
+
+def produce_albums(description, cover_description, num_songs, num_albums=1, resume=True, parallel_albums=1,
+                   background_uploads=True, combined_metadata=True, tags=None, privacy='public'):
+    # Uploads left in the queue by an interrupted run start again straight away
+    upload_queue = UploadQueue().start() if background_uploads else None
+    album = partial(main_loop, upload_queue=upload_queue, combined_metadata=combined_metadata, tags=tags,
+                    privacy=privacy)
+
+    try:
+        # Finish albums left over from an interrupted run before starting new ones
+        if resume:
+            for job in unfinished_jobs():
+                if job.params.get("queued_album") is not None:
+                    # Albums from the queue are resumed by the daemon that leases them
+                    continue
+                try:
+                    print(f"Resuming album job {job.id}...")
+                    album(job.params["description"], job.params["cover_description"], job.params["num_songs"],
+                          job=job)
+                except Exception as e:
+                    print(f"An error occurred while resuming job {job.id}: {e}")
+
+        if parallel_albums > 1:
+            # Work out every album's prompts up front, then produce the albums concurrently
+            album_specs = [(description, cover_description, num_songs)
+                           for description, cover_description in album_prompts(description, cover_description,
+                                                                                num_albums)]
+            run_albums(album, album_specs, max_albums=parallel_albums)
+            return
+
+        image_prompt = None
+        for _ in range(num_albums):
+            try:
+                # With background uploads, the next album starts while this one uploads
+                metadata = album(description, cover_description, num_songs, image_prompt=image_prompt)
+                print("Waiting before next iteration...")
+                time.sleep(10)  # Adjust the delay as needed
+                # The combined metadata request already wrote the next prompts; otherwise ask for them now
+                if metadata.get('next_description') and metadata.get('next_cover_description'):
+                    description = metadata['next_description']
+                    cover_description = metadata['next_cover_description']
+                    image_prompt = metadata.get('next_image_prompt')
+                else:
+                    description = edit_description(description) or description
+                    cover_description = edit_cover_description(cover_description) or cover_description
+                    image_prompt = None
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                time.sleep(60)  # Wait before retrying if there's an error
+    finally:
+        if upload_queue is not None:
+            print(f"Waiting for queued uploads to finish: {upload_queue.status()}")
+            upload_queue.close()
+            print(f"Uploads finished: {upload_queue.status()}")
+
+def album_prompts(description, cover_description, num_albums):
+    """(description, cover_description) for num_albums albums, each slightly changed from the one before."""
+    prompts = []
+    for _ in range(num_albums):
+        prompts.append((description, cover_description))
+        if len(prompts) < num_albums:
+            description = edit_description(description) or description
+            cover_description = edit_cover_description(cover_description) or cover_description
+    return prompts
+
+def enqueue_albums(album_queue, description, cover_description, num_songs, num_albums=1, tags=(),
+                   privacy='public'):
+    """Add num_albums album specs to the queue, with the prompts varied like a run of albums. Returns their ids."""
+    album_ids = []
+    for description, cover_description in album_prompts(description, cover_description, num_albums):
+        album_id = album_queue.enqueue(description, cover_description, num_songs, tags, privacy)
+        print(f"Queued album {album_id}: {description!r}")
+        album_ids.append(album_id)
+    return album_ids
+
+def queued_album(album_queue, entry, worker, limits=None, combined_metadata=True):
+    """
+    Produce one leased album, heartbeating while it runs. A retried or taken-over album
+    resumes its job directory, so only the stages that didn't finish run again.
+    Returns (seconds per stage, YouTube video id).
+    """
+    if entry["job_dir"] and os.path.exists(os.path.join(entry["job_dir"], "manifest.json")):
+        job = AlbumJob.load(entry["job_dir"])
+    else:
+        job = AlbumJob.create({"description": entry["description"], "cover_description": entry["cover_description"],
+                               "num_songs": entry["iterations"], "image_prompt": None, "queued_album": entry["id"]})
+        if not album_queue.set_job_dir(entry["id"], worker, job.job_dir):
+            raise JobCancelled(f"Lost the lease on album {entry['id']} before it started")
+
+    # Stage records carry the job id, including those of the album's helper threads
+    timings = {}
+    def record_timing(record):
+        if record.get("job") == job.id:
+            timings[record["stage"]] = round(timings.get(record["stage"], 0) + record["wall_seconds"], 3)
+
+    add_listener(record_timing)
+    try:
+        # A lost lease cancels the job, so the album stops at its next stage instead of racing
+        # the worker that took it over
+        lost = partial(job.cancel, f"lease on album {entry['id']} was lost")
+        with album_queue.keep_leased(entry["id"], worker, lost):
+            main_loop(entry["description"], entry["cover_description"], entry["iterations"], job=job,
+                      limits=limits, combined_metadata=combined_metadata, tags=entry["tags"],
+                      privacy=entry["privacy"])
+    finally:
+        remove_listener(record_timing)
+    return timings, (job.stage('upload') or {}).get('video_id')
+
+def queue_worker(album_queue, worker, stop, current, limits=None, combined_metadata=True, poll_interval=10,
+                 drain=False):
+    # Lease and produce albums until stopped or, with drain, until no album is queued or leased
+    # anywhere; albums waiting out a retry backoff still count, so drain waits for their retries
+    while not stop.is_set():
+        entry = album_queue.lease(worker)
+        if entry is None:
+            status = album_queue.status()
+            if drain and not status.get('queued') and not status.get('leased'):
+                return
+            stop.wait(poll_interval)
+            continue
+        current[worker] = entry["id"]
+        print(f"{worker} leased album {entry['id']} (attempt {entry['attempts']}): {entry['description']!r}")
+        try:
+            timings, video_id = queued_album(album_queue, entry, worker, limits, combined_metadata)
+            if album_queue.complete(entry["id"], worker, timings, video_id):
+                print(f"Album {entry['id']} done: {timings}")
+            else:
+                print(f"Album {entry['id']} finished, but {worker} had lost its lease; not marking it done.")
+        except JobCancelled as e:
+            # The album belongs to another worker now; it is not this worker's failure to record
+            print(f"{worker} stopped album {entry['id']}: {e}")
+        except Exception as e:
+            album_queue.fail(entry["id"], worker, f"{e.__class__.__name__}: {e}")
+        finally:
+            del current[worker]
+
+def run_daemon(album_queue, workers=1, combined_metadata=True, poll_interval=10, drain=False):
+    """
+    Produce queued albums with several worker threads until interrupted. More daemons can
+    share the same queue file; each album is leased by one worker at a time. On Ctrl-C
+    the albums in progress are handed back so the next daemon resumes them straight away.
+    """
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    stop = threading.Event()
+    current = {}
+    # Workers share the Suno, OpenAI and YouTube limits and one CPU pool, like parallel albums
+    limits = StageLimits() if workers > 1 else None
+    threads = []
+    for number in range(workers):
+        thread = threading.Thread(target=queue_worker, name=f"album-worker-{number}", daemon=True,
+                                  args=(album_queue, f"{name}:{number}", stop, current, limits, combined_metadata,
+                                        poll_interval, drain))
+        thread.start()
+        threads.append(thread)
+    print(f"Album daemon {name} running {workers} worker(s) on {album_queue.path}: {album_queue.status()}")
+    try:
+        for thread in threads:
+            # A timeout keeps the main thread responsive to Ctrl-C
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for worker, album_id in list(current.items()):
+            print(f"Handing album {album_id} back to the queue.")
+            album_queue.release(album_id, worker)
+    finally:
+        if limits is not None:
+            limits.shutdown()
+    print(f"Album daemon stopped: {album_queue.status()}")
+
+def print_queue(album_queue, limit=20):
+    print(f"Album queue {album_queue.path}: {album_queue.status()}")
+    for entry in album_queue.entries(limit=limit):
+        line = f"{entry['id']:>5}  {entry['status']:<7} attempts={entry['attempts']}  {entry['description'][:50]!r}"
+        if entry["video_id"]:
+            line += f"  video={entry['video_id']}"
+        if entry["timings"]:
+            line += f"  album={entry['timings'].get('album', 0):.0f}s"
+        if entry["error"] and entry["status"] != 'done':
+            line += f"  error={entry['error'][:60]}"
+        print(line)
+
+def load_settings(config_path=None, overrides=None):
+    """Defaults, updated from a JSON config file and then from any overrides that are not None."""
+    settings = dict(DEFAULT_SETTINGS)
+    if config_path:
+        with open(config_path, 'r', encoding='utf-8') as file:
+            config = json.load(file)
+        unknown = set(config) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings in {config_path}: {', '.join(sorted(unknown))}")
+        settings.update(config)
+    settings.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    return settings
+
+def prompt_settings(settings):
+    """Ask for the album settings on the terminal; blank answers keep the current value."""
+    settings = dict(settings)
     # Get a description for the album's music
     description = input("Enter a description for the album music: ")
-    if not description:  # Check if input is blank
-        description = "lofi chill retro arcade"
+    if description:
+        settings["description"] = description
 
     # Get a separate prompt for the cover image
     cover_description = input("Enter a description for the album cover image: ")
-    if not cover_description:  # Check if input is blank
-        cover_description = "tiltshift, miniture diorama, student study room, cozy, warm, low light"
-
-    num_songs = input("Enter the number of iterations (2 songs per iteration, default is 9): ")
-    if not num_songs:  # Check if input is blank
-        num_songs = 9
-    else:
-        num_songs = int(num_songs)  # Convert to integer if input is not blank
-
-    num_albums = input("Enter the number of albums you would like to make (default is 1): ")
-    if not num_albums:  # Check if input is blank
-        num_albums = 1
-    else:
-        num_albums = int(num_albums)  # Convert to integer if input is not blank
-
-
-    for _ in range(num_albums):
-        try:
-            main_loop(description, cover_description, num_songs)
-            print("Waiting before next iteration...")
-            time.sleep(10)  # Adjust the delay as needed
-            description = edit_description(description)
-            cover_description = edit_cover_description(cover_description)
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            time.sleep(60)  # Wait before retrying if there's an error
+    if cover_description:
+        settings["cover_description"] = cover_description
+
+    iterations = input(f"Enter the number of iterations (2 songs per iteration, default is {settings['iterations']}): ")
+    if iterations:
+        settings["iterations"] = int(iterations)
+
+    albums = input(f"Enter the number of albums you would like to make (default is {settings['albums']}): ")
+    if albums:
+        settings["albums"] = int(albums)
+    return settings
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate lofi albums with Suno and OpenAI and upload them to YouTube.")
+    parser.add_argument("--config", help="JSON file with any of the settings below (command-line values win)")
+    parser.add_argument("-d", "--description", help="prompt for the album music")
+    parser.add_argument("-c", "--cover-description", help="prompt for the album cover image")
+    parser.add_argument("-n", "--iterations", type=int, help="Suno batches per album, 2 songs each (default 9)")
+    parser.add_argument("-a", "--albums", type=int, help="number of albums to make (default 1)")
+    parser.add_argument("-p", "--parallel-albums", type=int, help="albums produced at the same time (default 1)")
+    parser.add_argument("--no-resume", dest="resume", action="store_const", const=False,
+                        help="don't finish albums left over from an interrupted run first")
+    parser.add_argument("--no-background-uploads", dest="background_uploads", action="store_const", const=False,
+                        help="upload each album before starting the next one")
+    parser.add_argument("--separate-metadata", dest="combined_metadata", action="store_const", const=False,
+                        help="write the title, description and next prompts with one request each")
+    parser.add_argument("--tags", type=lambda value: [tag.strip() for tag in value.split(",") if tag.strip()],
+                        help="comma-separated YouTube tags (default lofi,jazz,study)")
+    parser.add_argument("--privacy", choices=("public", "unlisted", "private"),
+                        help="YouTube privacy status (default public)")
+    parser.add_argument("--suno-submissions-per-minute", type=float, metavar="RATE",
+                        help="pace Suno generate calls across all albums to RATE a minute (default: unpaced)")
+    parser.add_argument("--suno-burst", type=int, metavar="N",
+                        help="with --suno-submissions-per-minute, allow N generate calls back to back (default 1)")
+    parser.add_argument("--queue", help="SQLite album queue used by --enqueue and --daemon (default album_queue.db)")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="add the album(s) to the queue for a daemon instead of producing them now")
+    parser.add_argument("--daemon", action="store_true",
+                        help="produce queued albums until interrupted, with --parallel-albums workers")
+    parser.add_argument("--drain", action="store_true", help="with --daemon, stop once every album is done or failed "
+                             "(waiting for albums in progress and for pending retries)")
+    parser.add_argument("--queue-status", action="store_true", help="print the album queue and exit")
+    parser.add_argument("--requeue", type=int, metavar="ID", help="put a failed queued album back in the queue")
+    parser.add_argument("--interactive", action="store_true", help="ask for the settings on the terminal")
+    parser.add_argument("--dry-run", action="store_true", help="print the resolved settings and exit")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = {key: value for key, value in vars(args).items() if key in DEFAULT_SETTINGS}
+    settings = load_settings(args.config, overrides)
+    if args.interactive:
+        settings = prompt_settings(settings)
+    if args.dry_run:
+        print(json.dumps(settings, indent=2))
+        return
+    suno_quota.pace(settings["suno_submissions_per_minute"], settings["suno_burst"])
+
+    if args.enqueue or args.daemon or args.queue_status or args.requeue is not None:
+        from jobqueue import JobQueue
+        album_queue = JobQueue(settings["queue"])
+        if args.requeue is not None:
+            if not album_queue.requeue(args.requeue):
+                print(f"Album {args.requeue} is not a failed album in {album_queue.path}.")
+        if args.enqueue:
+            enqueue_albums(album_queue, settings["description"], settings["cover_description"],
+                           settings["iterations"], settings["albums"], settings["tags"], settings["privacy"])
+        if args.queue_status:
+            print_queue(album_queue)
+        if args.daemon:
+            run_daemon(album_queue, workers=settings["parallel_albums"],
+                       combined_metadata=settings["combined_metadata"], drain=args.drain)
+        return
+
+    produce_albums(settings["description"], settings["cover_description"], settings["iterations"],
+                   num_albums=settings["albums"], resume=settings["resume"],
+                   parallel_albums=settings["parallel_albums"], background_uploads=settings["background_uploads"],
+                   combined_metadata=settings["combined_metadata"], tags=settings["tags"],
+                   privacy=settings["privacy"])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,42 @@
+import json
+import os
+import uuid
+from contextlib import contextmanager
+
+
+def temp_path(path):
+    """A temporary name next to path that no other process or thread writing path will pick."""
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+@contextmanager
+def replacing(path):
+    """
+    Yield a temporary path to write the new contents of path to. When the block succeeds it
+    replaces path in one step, so readers (and a crash) only ever see the old or the whole
+    new file; when it fails the temporary file is removed.
+    """
+    temp = temp_path(path)
+    try:
+        yield temp
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def atomic_open(path, mode='w'):
+    """Open a file whose contents replace path atomically once it is closed without error."""
+    with replacing(path) as temp:
+        with open(temp, mode, encoding=None if 'b' in mode else 'utf-8') as file:
+            yield file
+
+
+def write_json(path, value, **options):
+    """Atomically replace path with value as JSON; options go to json.dump."""
+    with atomic_open(path) as file:
+        json.dump(value, file, **options)
@@ -0,0 +1,173 @@
+import numpy as np
+
+# Album loudness target and peak ceiling, in dB relative to full scale
+TARGET_LOUDNESS = -16.0
+PEAK_CEILING = -1.0
+
+# Gated loudness uses 400 ms blocks, like ITU-R BS.1770 (without its K-weighting filter)
+BLOCK_SECONDS = 0.4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+FULL_SCALE = 32768.0
+
+
+def _chunks(frames, chunk_frames):
+    """(start, stop) ranges covering frames, chunk_frames at a time (all at once if None)."""
+    step = chunk_frames or frames or 1
+    return [(start, min(start + step, frames)) for start in range(0, frames, step)]
+
+
+def _to_int16(samples):
+    # Samples are processed as float32 on the int16 scale, so conversion is a clip and a cast
+    np.clip(samples, -FULL_SCALE, FULL_SCALE - 1, out=samples)
+    return samples.astype(np.int16)
+
+
+def measure(samples, frame_rate=44100, chunk_frames=None):
+    """
+    Return (loudness, peak) of int16 samples in dBFS.
+
+    Loudness is the gated mean power of 400 ms blocks summed over channels: blocks below
+    -70 dB are ignored, then blocks more than 10 dB under the average of the rest. Returns
+    None for silent audio. With chunk_frames the samples are converted a chunk at a time,
+    so only one chunk of floats is ever allocated.
+    """
+    if len(samples) == 0:
+        return None, None
+    peak = max(int(samples.max()), -int(samples.min()))
+    peak_db = 20 * np.log10(peak / FULL_SCALE) if peak else None
+
+    block = max(int(BLOCK_SECONDS * frame_rate), 1)
+    if len(samples) < block:
+        # Shorter than one block: measure it as a single block
+        block = len(samples)
+    if chunk_frames:
+        # Chunks must hold whole blocks so no block straddles two chunks
+        chunk_frames = max(chunk_frames // block, 1) * block
+
+    powers = []
+    for start, stop in _chunks(len(samples) // block * block, chunk_frames):
+        framed = samples[start:stop].astype(np.float32).reshape((stop - start) // block, -1)
+        # Sum of squares per block over all channels, as mean power relative to full scale
+        powers.append(np.einsum('ij,ij->i', framed, framed) / (block * FULL_SCALE ** 2))
+
+    powers = np.concatenate(powers)
+    powers = powers[powers > 10 ** (ABSOLUTE_GATE / 10)]
+    if len(powers) == 0:
+        return None, peak_db
+    relative_gate = powers.mean() * 10 ** (RELATIVE_GATE / 10)
+    powers = powers[powers > relative_gate]
+    return float(10 * np.log10(powers.mean())), peak_db
+
+
+def normalization_gain(loudness, peak, target=TARGET_LOUDNESS, ceiling=PEAK_CEILING):
+    """Linear gain that brings loudness to target without pushing the peak over ceiling."""
+    if loudness is None or peak is None:
+        return 1.0
+    gain_db = min(target - loudness, ceiling - peak)
+    return float(10 ** (gain_db / 20))
+
+
+def _quarter_sine(start, stop, length, rising=True):
+    """Equal-power fade curve values for positions [start, stop) of a fade of the given length."""
+    position = (np.arange(start, stop, dtype=np.float32) + 0.5) / length * (np.pi / 2)
+    return (np.sin(position) if rising else np.cos(position))[:, None]
+
+
+def apply_fades(chunk, chunk_start, frames, fade_in=0, fade_out=0):
+    """
+    Fade a chunk that starts at frame chunk_start of a track of the given length, in place.
+    Only the frames that fall inside the fade-in or fade-out are touched.
+    """
+    chunk_stop = chunk_start + len(chunk)
+    if fade_in and chunk_start < fade_in:
+        stop = min(fade_in, chunk_stop)
+        chunk[:stop - chunk_start] *= _quarter_sine(chunk_start, stop, fade_in)
+    if fade_out and chunk_stop > frames - fade_out:
+        start = max(frames - fade_out, chunk_start)
+        offset = frames - fade_out
+        chunk[start - chunk_start:] *= _quarter_sine(start - offset, chunk_stop - offset, fade_out, rising=False)
+    return chunk
+
+
+class AlbumMixer:
+    """
+    Normalize, fade and crossfade decoded tracks with NumPy and stream them into an AlbumEncoder.
+
+    Each track is measured once and then written once, with its loudness gain, fades and
+    any equal-power crossfade applied in the same vectorized pass. Only the crossfade tail
+    of the previous track is held back between tracks. With chunk_seconds the float work is
+    done a chunk at a time, so long tracks never need a full-length float copy.
+
+    Durations are in milliseconds; target_loudness=None disables normalization.
+    """
+
+    def __init__(self, encoder, fade_in=0, fade_out=1000, crossfade=0, target_loudness=TARGET_LOUDNESS,
+                 peak_ceiling=PEAK_CEILING, chunk_seconds=10):
+        if encoder.sample_width != 2:
+            raise ValueError("AlbumMixer writes 16-bit samples; create the encoder with sample_width=2.")
+        self.encoder = encoder
+        self.frame_rate = encoder.frame_rate
+        self.fade_in = self._frames(fade_in)
+        self.fade_out = self._frames(fade_out)
+        self.crossfade = self._frames(crossfade)
+        self.target_loudness = target_loudness
+        self.peak_ceiling = peak_ceiling
+        self.chunk_frames = int(chunk_seconds * self.frame_rate) if chunk_seconds else None
+        self.timestamps = []
+        self.loudness = []
+        self._tail = None  # Gain-adjusted end of the previous track, waiting to be crossfaded
+
+    def _frames(self, milliseconds):
+        return int(milliseconds * self.frame_rate / 1000)
+
+    def add(self, samples):
+        """Append an int16 (frames, channels) track. Returns its start time in seconds."""
+        frames = len(samples)
+        loudness, peak = measure(samples, self.frame_rate, self.chunk_frames)
+        self.loudness.append(loudness)
+        gain = 1.0
+        if self.target_loudness is not None:
+            gain = normalization_gain(loudness, peak, self.target_loudness, self.peak_ceiling)
+
+        # Overlap with the previous track, never more than half of either track
+        held = min(self.crossfade, frames // 2)
+        overlap = min(held, len(self._tail)) if self._tail is not None else 0
+
+        # A short track can't overlap all of the held tail; the rest is written as is
+        if self._tail is not None and len(self._tail) > overlap:
+            self.encoder.write_samples(_to_int16(self._tail[:len(self._tail) - overlap]))
+            self._tail = self._tail[len(self._tail) - overlap:]
+
+        start = self.encoder.frames_written / self.frame_rate
+        self.timestamps.append(start)
+
+        # Without a crossfade the track fades in and out on its own
+        fade_in = self.fade_in if overlap == 0 else 0
+        fade_out = self.fade_out if held == 0 else 0
+        body_stop = frames - held
+        for chunk_start, chunk_stop in _chunks(body_stop, self.chunk_frames):
+            chunk = samples[chunk_start:chunk_stop].astype(np.float32)
+            chunk *= gain
+            apply_fades(chunk, chunk_start, frames, fade_in, fade_out)
+            if chunk_start < overlap:
+                # Blend the start of this track with the held tail of the previous one
+                stop = min(overlap, chunk_stop)
+                blend = slice(0, stop - chunk_start)
+                chunk[blend] *= _quarter_sine(chunk_start, stop, overlap)
+                chunk[blend] += self._tail[chunk_start:stop] * _quarter_sine(chunk_start, stop, overlap, rising=False)
+            self.encoder.write_samples(_to_int16(chunk))
+
+        # Hold this track's end back for the next crossfade
+        self._tail = samples[body_stop:].astype(np.float32) * gain if held else None
+        return start
+
+    def finish(self):
+        """Write the last track's held tail with a fade-out and close the encoder."""
+        if self._tail is not None and len(self._tail):
+            apply_fades(self._tail, 0, len(self._tail), fade_out=min(self.fade_out, len(self._tail)))
+            self.encoder.write_samples(_to_int16(self._tail))
+            self._tail = None
+        path = self.encoder.finish()
+        return path, self.timestamps
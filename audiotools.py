@@ -0,0 +1,164 @@
+import json
+import os
+import subprocess
+
+# Layer III tables, indexed by the fields of an MPEG audio frame header
+MP3_BITRATES = {
+    'mpeg1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'mpeg2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+
+def _skip_id3v2(data):
+    """Return the offset of the first byte after an ID3v2 tag, or 0 if there is none."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _parse_frame_header(header):
+    """Decode a 4-byte Layer III frame header. Returns None if it is not a valid header."""
+    if header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = (header[2] >> 4) & 0x0F
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    table = 'mpeg1' if version == 3 else 'mpeg2'
+    mono = (header[3] >> 6) & 0x03 == 3
+    if version == 3:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    return {
+        'bitrate': MP3_BITRATES[table][bitrate_index] * 1000,
+        'sample_rate': MP3_SAMPLE_RATES[version][sample_rate_index],
+        'samples_per_frame': 1152 if version == 3 else 576,
+        'side_info': side_info,
+    }
+
+
+def mp3_duration(file_path):
+    """
+    Read an MP3's duration in seconds from its frame headers without decoding any audio.
+
+    Uses the Xing/Info or VBRI frame count when present and falls back to the CBR
+    estimate from the first frame's bitrate. Returns None if no frame header is found.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as file:
+        head = file.read(10)
+        offset = _skip_id3v2(head)
+        file.seek(offset)
+        data = file.read(64 * 1024)
+        file.seek(max(file_size - 128, 0))
+        has_id3v1 = file.read(3) == b'TAG'
+
+    for position in range(len(data) - 4):
+        frame = _parse_frame_header(data[position:position + 4])
+        if frame is None:
+            continue
+
+        # VBR files carry the total frame count in a Xing/Info or VBRI header inside the first frame
+        xing = position + 4 + frame['side_info']
+        frames = None
+        if data[xing:xing + 4] in (b'Xing', b'Info'):
+            flags = int.from_bytes(data[xing + 4:xing + 8], 'big')
+            if flags & 0x01:
+                frames = int.from_bytes(data[xing + 8:xing + 12], 'big')
+        elif data[position + 36:position + 40] == b'VBRI':
+            frames = int.from_bytes(data[position + 50:position + 54], 'big')
+        if frames:
+            return frames * frame['samples_per_frame'] / frame['sample_rate']
+
+        audio_bytes = file_size - offset - position - (128 if has_id3v1 else 0)
+        return audio_bytes * 8 / frame['bitrate']
+    return None
+
+
+def ffprobe_duration(file_path):
+    """Ask ffprobe for the container duration in seconds (no decoding)."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', file_path],
+        capture_output=True, text=True, check=True
+    )
+    return float(json.loads(result.stdout)['format']['duration'])
+
+
+def probe_duration(file_path):
+    """Return the duration of an audio file in seconds, from MP3 headers when possible, else ffprobe."""
+    if file_path.lower().endswith('.mp3'):
+        try:
+            duration = mp3_duration(file_path)
+            if duration is not None:
+                return duration
+        except OSError as e:
+            print(f"Failed to read MP3 headers of {file_path}. Reason: {e}")
+    return ffprobe_duration(file_path)
+
+
+# The combined album is encoded once, straight to the codec the MP4 will carry, and then
+# copied into the video without another decode/encode cycle.
+ALBUM_CODEC_ARGS = ['-c:a', 'aac', '-b:a', '192k']
+
+class AlbumEncoder:
+    """
+    Stream an album into a single ffmpeg encoder process as raw PCM.
+
+    Only the chunk currently being written is held in memory, so memory stays flat and
+    combining is linear in album length. The running length is counted in frames, so song
+    start times are exact. By default the output is AAC (ALBUM_CODEC_ARGS), which the video
+    encoder copies into the MP4 as is.
+    """
+
+    def __init__(self, output_path, frame_rate=44100, channels=2, sample_width=2, codec_args=None):
+        self.output_path = output_path
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frames_written = 0
+        sample_format = {1: 'u8', 2: 's16le', 4: 's32le'}[sample_width]
+        command = [
+            'ffmpeg', '-loglevel', 'error', '-y',
+            '-f', sample_format, '-ar', str(frame_rate), '-ac', str(channels), '-i', 'pipe:0',
+        ] + (ALBUM_CODEC_ARGS if codec_args is None else codec_args) + [output_path]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write_samples(self, samples):
+        """Append already converted PCM: an array of shape (frames, channels) in the album's sample format."""
+        self._process.stdin.write(samples)
+        self.frames_written += len(samples)
+
+    @property
+    def duration(self):
+        """Length of the audio written so far, in seconds."""
+        return self.frames_written / self.frame_rate
+
+    def finish(self):
+        """Close the encoder and wait for it. Returns the output path."""
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise Exception(f"ffmpeg failed to encode {self.output_path} (exit code {self._process.returncode}).")
+        return self.output_path
+
+    def abort(self):
+        """Stop the encoder without waiting for a complete file."""
+        self._process.kill()
+        self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
@@ -0,0 +1,80 @@
+"""
+Combine time and loudness spread of the NumPy mixer, whole-song versus chunked and with
+crossfades.
+
+Generates synthetic songs at deliberately different levels, decodes them into a PcmStore
+and mixes them with AlbumMixer, as the app does, to raw PCM (no AAC encode, so only the
+audio processing is timed), then reports the wall time and the spread of per-song
+loudness in the result.
+
+Usage: python benchmarks/bench_audio.py [num_songs] [seconds]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audioengine import AlbumMixer, measure
+from audiotools import AlbumEncoder
+from pipeline import decoded_samples
+
+RAW_PCM = ['-f', 's16le']
+
+
+def make_songs(folder, num_songs, seconds):
+    paths = []
+    for i in range(num_songs):
+        path = os.path.join(folder, f"song_{i}.mp3")
+        # Every song at a different volume, from -30 dB to -6 dB
+        volume = -30 + 24 * i / max(num_songs - 1, 1)
+        subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi',
+             '-i', f"anoisesrc=duration={seconds}:color=pink:seed={i}", '-af', f"volume={volume}dB",
+             '-ac', '2', '-ar', '44100', '-b:a', '192k', path],
+            check=True
+        )
+        paths.append(path)
+    return paths
+
+
+def combine_numpy(paths, output_path, chunk_seconds=10, crossfade=0):
+    with AlbumEncoder(output_path, codec_args=RAW_PCM) as encoder:
+        mixer = AlbumMixer(encoder, fade_out=1000, crossfade=crossfade, chunk_seconds=chunk_seconds)
+        for _, samples in decoded_samples(paths, min_duration=0):
+            mixer.add(samples)
+        return mixer.finish()
+
+
+def loudness_spread(output_path, timestamps):
+    """Max minus min loudness of the songs inside the combined PCM, in dB."""
+    import numpy as np
+    samples = np.fromfile(output_path, dtype=np.int16).reshape(-1, 2)
+    bounds = [int(t * 44100) for t in timestamps] + [len(samples)]
+    levels = [measure(samples[start:stop])[0] for start, stop in zip(bounds, bounds[1:])]
+    return round(max(levels) - min(levels), 2)
+
+
+def main():
+    num_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 180
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_songs(folder, num_songs, seconds)
+        modes = [
+            ('numpy', combine_numpy, {'chunk_seconds': None}),
+            ('numpy-chunked', combine_numpy, {}),
+            ('numpy-crossfade', combine_numpy, {'crossfade': 3000}),
+        ]
+        for name, func, options in modes:
+            output_path = os.path.join(folder, f"{name}.pcm")
+            started = time.perf_counter()
+            _, timestamps = func(paths, output_path, **options)
+            wall = time.perf_counter() - started
+            print({'mode': name, 'wall_seconds': round(wall, 2),
+                   'loudness_spread_db': loudness_spread(output_path, timestamps)})
+
+
+if __name__ == "__main__":
+    main()
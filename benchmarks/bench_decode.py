@@ -0,0 +1,100 @@
+"""
+Decode count and peak RSS for combining an album, before the single-decode path and with
+the pipeline the app uses now (combine_files).
+
+Generates synthetic MP3s with ffmpeg and runs each mode in a fresh process so peak RSS
+is measured independently. Usage: python benchmarks/bench_decode.py [num_songs] [seconds]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_songs(folder, num_songs, seconds):
+    paths = []
+    for i in range(num_songs):
+        path = os.path.join(folder, f"song_{i}.mp3")
+        subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi',
+             '-i', f"sine=frequency={220 + 20 * i}:duration={seconds}",
+             '-ac', '2', '-ar', '44100', '-b:a', '192k', path],
+            check=True
+        )
+        paths.append(path)
+    return paths
+
+
+def count_decodes():
+    """Wrap AudioSegment.from_file and PcmStore.decode so every decode is counted."""
+    from pydub import AudioSegment
+    from pcmstore import PcmStore
+    original = AudioSegment.from_file.__func__
+    original_decode = PcmStore.decode
+    counter = {'decodes': 0}
+
+    def counted(cls, *args, **kwargs):
+        counter['decodes'] += 1
+        return original(cls, *args, **kwargs)
+
+    def counted_decode(self, *args, **kwargs):
+        counter['decodes'] += 1
+        return original_decode(self, *args, **kwargs)
+
+    AudioSegment.from_file = classmethod(counted)
+    PcmStore.decode = counted_decode
+    return counter
+
+
+def run_before(paths, output_path):
+    # The original filter_short_songs + combine_songs: every file is decoded twice
+    from pydub import AudioSegment
+    valid = [path for path in paths if len(AudioSegment.from_file(path)) / 1000 >= 30]
+    combined_audio = AudioSegment.empty()
+    for path in valid:
+        combined_audio += AudioSegment.from_file(path).fade_out(1000)
+    combined_audio.export(output_path, format="mp3")
+
+
+def run_after(paths, output_path):
+    # The live path: decode once into a PcmStore, check, normalize, fade and encode
+    from pipeline import combine_files
+    combine_files(paths, output_path, min_duration=30)
+
+
+def measure(mode, paths, output_path):
+    # Run inside the temporary folder so clip fingerprints don't end up in the real .cache
+    os.chdir(os.path.dirname(output_path))
+    counter = count_decodes()
+    started = time.perf_counter()
+    {'before': run_before, 'after': run_after}[mode](paths, output_path)
+    return {
+        'mode': mode,
+        'decodes': counter['decodes'],
+        'seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    num_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 18
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 180
+    context = get_context('spawn')
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_songs(folder, num_songs, seconds)
+        for mode in ('before', 'after'):
+            # A fresh single-worker pool per mode keeps the peak RSS figures independent
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                extension = 'mp3' if mode == 'before' else 'm4a'
+                print(pool.submit(measure, mode, paths, os.path.join(folder, f"{mode}.{extension}")).result())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+End-to-end pipeline benchmark against local fake Suno, OpenAI and YouTube services.
+
+Every scenario runs the real main_loop (song generation, cover, combine, video, upload)
+in a fresh process and temporary working directory, then prints the per-stage timings
+and peak memory from the run log, alongside what the fake services saw.
+
+Usage: python benchmarks/bench_pipeline.py [scenario ...] [--mode streaming|batch|sequential]
+       [--clip-seconds N] [--generation-seconds N] [--error-rate F] [--duplicate-rate F] [--keep]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# iterations: Suno batches (2 songs each) per album; albums run one after another unless parallel > 1
+SCENARIOS = {
+    'album-1': {'iterations': 1, 'albums': 1},
+    'album-9': {'iterations': 9, 'albums': 1},
+    'album-50': {'iterations': 50, 'albums': 1},
+    'albums-3-queued': {'iterations': 9, 'albums': 3, 'background_uploads': True},
+    'albums-3-parallel': {'iterations': 9, 'albums': 3, 'parallel': 3},
+}
+
+MODES = {
+    'streaming': {'concurrent': True, 'streaming': True},
+    'batch': {'concurrent': True, 'streaming': False},
+    'sequential': {'concurrent': False, 'streaming': False},
+}
+
+
+def run_scenario(name, scenario, mode, server_options, chat_latency, image_latency):
+    """Run one scenario in this (fresh) process and return its report."""
+    folder = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    os.chdir(folder)
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+    from fakes import FakeOpenAI, FakeServer, OfflineCredentials, youtube_service
+    server = FakeServer(**server_options).start()
+
+    # Point every client at the fakes before the pipeline first uses them
+    import callapi
+    import openaiapi
+    import tracing
+    import uploadtoyoutube
+    callapi.base_url = server.url
+    fake_openai = FakeOpenAI(server, chat_latency=chat_latency, image_latency=image_latency)
+    openaiapi._client = fake_openai
+    uploadtoyoutube._services['token.pickle'] = (youtube_service(server), OfflineCredentials())
+    tracing.RUN_LOG = os.path.join(folder, "run_log.jsonl")
+
+    import app
+    from uploadqueue import UploadQueue
+    from workerpool import run_albums
+
+    album = partial(app.main_loop, **MODES[mode])
+    specs = [(f"offline album {i}", f"offline cover {i}", scenario['iterations']) for i in range(scenario['albums'])]
+    started = time.perf_counter()
+    if scenario.get('parallel', 1) > 1:
+        failures = run_albums(album, specs, max_albums=scenario['parallel'])
+    else:
+        failures = []
+        upload_queue = UploadQueue().start() if scenario.get('background_uploads') else None
+        for spec in specs:
+            try:
+                album(*spec, upload_queue=upload_queue)
+            except Exception as e:
+                failures.append((spec, e))
+        if upload_queue is not None:
+            upload_queue.close()
+    wall = time.perf_counter() - started
+    server.stop()
+
+    return {
+        'scenario': name,
+        'mode': mode,
+        'wall_seconds': round(wall, 2),
+        'failures': [str(error) for _, error in failures],
+        'stages': tracing.summarize(tracing.read_records(tracing.RUN_LOG)),
+        'server': server.stats,
+        'openai_calls': fake_openai.calls,
+        'workdir': folder,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the album pipeline against local fake services.")
+    parser.add_argument('scenarios', nargs='*', default=['album-1', 'album-9', 'albums-3-queued'],
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: %(default)s)")
+    parser.add_argument('--mode', choices=MODES, default='streaming')
+    parser.add_argument('--clip-seconds', type=float, default=60, help="length of every fake song")
+    parser.add_argument('--generation-seconds', type=float, default=5, help="fake Suno time until streaming")
+    parser.add_argument('--complete-after', type=float,
+                        help="seconds a fake clip streams before it is 'complete' (default: never)")
+    parser.add_argument('--api-latency', type=float, default=0.05, help="delay on every fake Suno request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of Suno requests that fail")
+    parser.add_argument('--duplicate-rate', type=float, default=0.0,
+                        help="fraction of Suno batches whose two clips are the same")
+    parser.add_argument('--chat-latency', type=float, default=0.5)
+    parser.add_argument('--image-latency', type=float, default=2.0)
+    parser.add_argument('--json', action='store_true', help="print the reports as JSON lines")
+    parser.add_argument('--keep', action='store_true', help="keep each scenario's working directory")
+    args = parser.parse_args()
+
+    server_options = {'clip_seconds': args.clip_seconds, 'generation_seconds': args.generation_seconds,
+                      'complete_after': args.complete_after, 'api_latency': args.api_latency, 'error_rate': args.error_rate,
+                      'duplicate_rate': args.duplicate_rate}
+    from tracing import print_summary
+    for name in args.scenarios:
+        # A fresh process per scenario keeps peak RSS and module state independent
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            report = executor.submit(run_scenario, name, SCENARIOS[name], args.mode, server_options,
+                                     args.chat_latency, args.image_latency).result()
+        if not args.keep:
+            shutil.rmtree(report.pop('workdir'), ignore_errors=True)
+        if args.json:
+            print(json.dumps(report))
+            continue
+        print(f"\n== {name} ({args.mode}): {report['wall_seconds']}s, failures: {len(report['failures'])}")
+        print_summary(report['stages'])
+        print(f"server: {report['server']}  openai: {report['openai_calls']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Wall time and CPU-seconds for rendering a synthetic album video with the MoviePy path
+and with the still-image encoder.
+
+Usage: python benchmarks/bench_video.py [minutes]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from videoencoder import encode_still_video
+
+
+def make_inputs(folder, minutes):
+    audio_path = os.path.join(folder, "album.mp3")
+    cover_path = os.path.join(folder, "cover.png")
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', f"sine=duration={minutes * 60}",
+                    '-ac', '2', '-b:a', '192k', audio_path], check=True)
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc2=size=1820x1024',
+                    '-frames:v', '1', cover_path], check=True)
+    return audio_path, cover_path
+
+
+def run_moviepy(audio_path, cover_path, output_path):
+    # The original create_video
+    from moviepy.editor import AudioFileClip, ImageClip
+    audio_clip = AudioFileClip(audio_path)
+    image_clip = ImageClip(cover_path).set_duration(audio_clip.duration).set_audio(audio_clip)
+    image_clip.write_videofile(output_path, codec="libx264", fps=24, logger=None)
+
+
+def run_still(audio_path, cover_path, output_path):
+    encode_still_video(cover_path, audio_path, output_path)
+
+
+def measure(name, func, *args):
+    # os.times() covers both this process and the ffmpeg children it waited for
+    before_times, started = os.times(), time.perf_counter()
+    func(*args)
+    after_times = os.times()
+    cpu = sum(after_times[:4]) - sum(before_times[:4])
+    print({'mode': name, 'wall_seconds': round(time.perf_counter() - started, 2), 'cpu_seconds': round(cpu, 2)})
+
+
+def main():
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    with tempfile.TemporaryDirectory() as folder:
+        audio_path, cover_path = make_inputs(folder, minutes)
+        measure('still', run_still, audio_path, cover_path, os.path.join(folder, "still.mp4"))
+        try:
+            measure('moviepy', run_moviepy, audio_path, cover_path, os.path.join(folder, "moviepy.mp4"))
+        except ImportError:
+            print("moviepy is not installed; skipping the MoviePy baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Local stand-ins for the Suno API, the OpenAI client and the YouTube upload endpoint, so
+the real pipeline code can be run and timed without network access or credentials.
+
+FakeServer is one threaded HTTP server that serves:
+  - the Suno API (/api/generate, /api/get, /api/get_limit) with configurable generation
+    time, per-request latency and error rate, plus synthetic MP3s for every clip
+  - generated cover images for the fake OpenAI client to hand out as URLs
+  - a YouTube resumable upload endpoint that accepts and discards the uploaded bytes
+"""
+import io
+import json
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+RATE_LIMIT_HEADERS = {
+    'x-ratelimit-remaining-requests': '5000',
+    'x-ratelimit-remaining-tokens': '1000000',
+    'x-ratelimit-reset-requests': '1ms',
+    'x-ratelimit-reset-tokens': '1ms',
+}
+
+# Fake clips are random sequences of this many seconds of different noise each
+SEGMENT_SECONDS = 2.5
+
+
+def synthetic_segments(count=64, seconds=SEGMENT_SECONDS):
+    """
+    Short MP3s of pulsing pink noise, a different noise in each, without ID3 or Xing
+    headers, so any sequence of them concatenates into one valid constant-bitrate MP3.
+    """
+    segments = []
+    for i in range(count):
+        with tempfile.NamedTemporaryFile(suffix=".mp3") as file:
+            subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi',
+                            '-i', f"anoisesrc=color=pink:seed={i}:amplitude=0.4:duration={seconds}",
+                            '-af', f"volume='0.6+0.4*sin(2*PI*t*{1 + i / 4})':eval=frame",
+                            '-ac', '2', '-ar', '44100', '-b:a', '192k', '-write_xing', '0', '-id3v2_version', '0',
+                            file.name], check=True)
+            segments.append(file.read())
+    return segments
+
+
+def synthetic_png(seed, size=1024):
+    """Noisy smooth colour blobs, a different picture (and perceptual hash) for every seed."""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    blobs = Image.fromarray(rng.integers(0, 256, (6, 6, 3), dtype=np.uint8), "RGB").resize((size, size), Image.BICUBIC)
+    pixels = np.asarray(blobs, dtype=np.float32) + rng.normal(0, 12, (size, size, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeServer:
+    """
+    generation_seconds: time from /api/generate until a clip reports 'streaming' (+/- jitter)
+    complete_after: seconds a clip stays 'streaming' before it reports 'complete'; 0 makes
+        clips go straight to 'complete', None (the default) keeps them streaming
+    api_latency: delay added to every Suno API response
+    error_rate: fraction of Suno API requests answered with HTTP 500
+    clip_seconds: length of the synthetic MP3 served for every clip; every clip is a random
+        sequence of short noise segments, so no two clips sound alike
+    duplicate_rate: fraction of batches whose second clip is a copy of the first
+    """
+
+    def __init__(self, generation_seconds=5, jitter=0.3, api_latency=0.05, error_rate=0.0, clip_seconds=60,
+                 duplicate_rate=0.0, credits=100000, seed=0, complete_after=None):
+        self.generation_seconds = generation_seconds
+        self.complete_after = complete_after
+        self.jitter = jitter
+        self.api_latency = api_latency
+        self.error_rate = error_rate
+        self.credits = credits
+        self.random = random.Random(seed)
+        self.duplicate_rate = duplicate_rate
+        self.segments = synthetic_segments()
+        self.slots = max(int(round(clip_seconds / SEGMENT_SECONDS)), 1)
+        self.images = {}
+        self.clips = {}           # clip ID -> time it will be ready
+        self.audio = {}           # clip ID -> MP3 bytes
+        self.uploads = {}         # session ID -> bytes received
+        self.stats = {'generate': 0, 'get': 0, 'get_limit': 0, 'errors': 0, 'audio_bytes': 0,
+                      'upload_bytes': 0, 'uploads': 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def image_url(self):
+        """Create a new cover image and return the URL it is served from."""
+        with self._lock:
+            image_id = len(self.images)
+            self.images[image_id] = synthetic_png(image_id)
+        return f"{self.url}/image/{image_id}.png"
+
+    def _clip_audio(self, clip_id, copy_of=None):
+        """MP3 for a new clip: a random sequence of the noise segments, or another clip's audio."""
+        if copy_of is not None:
+            self.audio[clip_id] = self.audio[copy_of]
+        else:
+            self.audio[clip_id] = b''.join(self.random.choice(self.segments) for _ in range(self.slots))
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b'', content_type='application/json', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, data, status=200):
+                self._send(status, json.dumps(data).encode())
+
+            def _suno_error(self):
+                time.sleep(server.api_latency)
+                if server.random.random() < server.error_rate:
+                    server._count('errors')
+                    self._send(500, b'{"error": "fake server error"}')
+                    return True
+                return False
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/api/get':
+                    server._count('get')
+                    if self._suno_error():
+                        return
+                    now = time.monotonic()
+                    songs = []
+                    for clip_id in parse_qs(url.query).get('ids', [''])[0].split(','):
+                        ready = server.clips.get(clip_id)
+                        if ready is None:
+                            continue
+                        if now < ready:
+                            songs.append({'id': clip_id, 'status': 'queued', 'audio_url': ''})
+                            continue
+                        complete = server.complete_after is not None and now >= ready + server.complete_after
+                        songs.append({'id': clip_id, 'status': 'complete' if complete else 'streaming',
+                                      'audio_url': f"{server.url}/audio/{clip_id}.mp3"})
+                    self._json(songs)
+                elif url.path == '/api/get_limit':
+                    server._count('get_limit')
+                    if self._suno_error():
+                        return
+                    self._json({'credits_left': server.credits, 'period': 'day', 'monthly_limit': server.credits,
+                                'monthly_usage': 0})
+                elif url.path.startswith('/audio/'):
+                    clip_id = url.path.rsplit('/', 1)[1].split('.')[0]
+                    if clip_id not in server.audio:
+                        self._send(404)
+                        return
+                    self._range(server.audio[clip_id], 'audio/mpeg')
+                elif url.path.startswith('/image/'):
+                    image_id = int(url.path.rsplit('/', 1)[1].split('.')[0])
+                    self._send(200, server.images[image_id], 'image/png')
+                else:
+                    self._send(404)
+
+            def _range(self, data, content_type):
+                # Enough of HTTP Range for the resumable downloader
+                match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+                start = int(match.group(1)) if match else 0
+                if start >= len(data):
+                    self._send(416, headers={'Content-Range': f"bytes */{len(data)}"})
+                    return
+                headers = {'Content-Range': f"bytes {start}-{len(data) - 1}/{len(data)}"} if match else {}
+                server._count('audio_bytes', len(data) - start)
+                self._send(206 if match else 200, data[start:], content_type, headers)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if url.path == '/api/generate':
+                    server._count('generate')
+                    if self._suno_error():
+                        return
+                    clips = []
+                    with server._lock:
+                        server.credits -= 10
+                        duplicate = server.random.random() < server.duplicate_rate
+                        for i in range(2):
+                            clip_id = str(uuid.uuid4())
+                            delay = server.generation_seconds * server.random.uniform(1 - server.jitter,
+                                                                                       1 + server.jitter)
+                            server.clips[clip_id] = time.monotonic() + delay
+                            server._clip_audio(clip_id, clips[0]['id'] if duplicate and i else None)
+                            clips.append({'id': clip_id, 'status': 'submitted'})
+                    self._json(clips)
+                elif url.path == '/upload/youtube/v3/videos':
+                    # Start a resumable upload session; the metadata in body is ignored
+                    session_id = str(uuid.uuid4())
+                    with server._lock:
+                        server.uploads[session_id] = 0
+                    self._send(200, headers={'Location': f"{server.url}/upload-session/{session_id}"})
+                else:
+                    self._send(404)
+
+            def do_PUT(self):
+                url = urlparse(self.path)
+                session_id = url.path.rsplit('/', 1)[1]
+                if session_id not in server.uploads:
+                    self._send(404)
+                    return
+                remaining = int(self.headers.get('Content-Length', 0))
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                    remaining -= len(chunk)
+                    server._count('upload_bytes', len(chunk))
+                    with server._lock:
+                        server.uploads[session_id] += len(chunk)
+
+                received = server.uploads[session_id]
+                total = self.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+                if total.isdigit() and received >= int(total):
+                    server._count('uploads')
+                    self._json({'id': f"fake-{session_id[:8]}", 'status': {'uploadStatus': 'uploaded'}})
+                else:
+                    headers = {'Range': f"bytes=0-{received - 1}"} if received else {}
+                    self._send(308, headers=headers)
+
+        return Handler
+
+
+class _RawResponse:
+    def __init__(self, parsed):
+        self.headers = RATE_LIMIT_HEADERS
+        self._parsed = parsed
+
+    def parse(self):
+        return self._parsed
+
+
+class _ImagesResponse:
+    def __init__(self, urls):
+        self.urls = urls
+
+    def model_dump(self):
+        return {'data': [{'url': url} for url in self.urls]}
+
+
+class FakeOpenAI:
+    """
+    Stands in for openai.OpenAI: chat completions return short canned text and image
+    requests return URLs of images generated by the FakeServer. Each call sleeps for
+    chat_latency or image_latency seconds first.
+    """
+
+    def __init__(self, server, chat_latency=0.5, image_latency=2.0):
+        self.server = server
+        self.chat_latency = chat_latency
+        self.image_latency = image_latency
+        self.calls = {'chat': 0, 'images': 0}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self._chat), create=self._parsed(self._chat)))
+        self.images = SimpleNamespace(
+            with_raw_response=SimpleNamespace(generate=self._image, edit=self._image),
+            generate=self._parsed(self._image), edit=self._parsed(self._image))
+
+    @staticmethod
+    def _parsed(func):
+        return lambda **kwargs: func(**kwargs).parse()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            return self.calls[name]
+
+    def reply(self, model, messages, **params):
+        """
+        Text returned for a chat request; override for other prompts. Structured requests
+        get a JSON object with one string for every property of their schema (and one
+        song name per timestamp in the request).
+        """
+        number = self.calls['chat']
+        response_format = params.get('response_format')
+        if response_format:
+            request = json.loads(messages[-1]['content'])
+            schema = response_format['json_schema']['schema']
+            reply = {name: f"Offline {name} {number}" for name in schema['properties']}
+            reply['song_names'] = [f"Song{number}x{i}" for i in range(len(request.get('timestamps', [])))]
+            return json.dumps(reply)
+        return f"Offline {model} reply {number} to: {messages[-1]['content'][:60]}"
+
+    def _chat(self, model, messages, **params):
+        self._count('chat')
+        time.sleep(self.chat_latency)
+        message = SimpleNamespace(content=self.reply(model, messages, **params))
+        return _RawResponse(SimpleNamespace(choices=[SimpleNamespace(message=message)]))
+
+    def _image(self, prompt=None, n=1, **params):
+        self._count('images')
+        time.sleep(self.image_latency)
+        return _RawResponse(_ImagesResponse([self.server.image_url() for _ in range(n)]))
+
+
+class OfflineCredentials:
+    """Credentials that are always valid, for the fake YouTube service."""
+    valid = True
+
+
+def youtube_service(server):
+    """A YouTube Data API client whose requests all go to the FakeServer."""
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = json.loads(get_static_doc('youtube', 'v3'))
+    document['rootUrl'] = document['mtlsRootUrl'] = f"{server.url}/"
+    return build_from_document(document, developerKey='offline-benchmark')
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from atomicfile import atomic_open
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache for generated text and image bytes.
+
+    Entries are keyed by a hash of the request (model, messages and parameters) and stored
+    as one file each. An entry's modification time is when its response was stored: entries
+    older than max_age seconds are ignored and removed, and the oldest entries are evicted
+    once the cache grows past max_bytes. Several threads and processes may share the cache.
+    Set bypass (or OPENAI_CACHE_BYPASS=1) to skip reads while still recording fresh results.
+    """
+
+    def __init__(self, directory=".cache/openai", max_bytes=500 * 1024 * 1024, max_age=7 * 24 * 3600,
+                 bypass=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.bypass = os.getenv("OPENAI_CACHE_BYPASS") == "1" if bypass is None else bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(**request):
+        """Hash a request description into a stable cache key."""
+        encoded = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _read(self, key, suffix):
+        data = None
+        if not self.bypass:
+            path = self._path(key, suffix)
+            # Another worker's eviction may remove the entry at any point; that is just a miss
+            try:
+                if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+                else:
+                    with open(path, 'rb') as file:
+                        data = file.read()
+            except FileNotFoundError:
+                pass
+        self._count(data is not None)
+        return data
+
+    def _write(self, key, suffix, data):
+        # The directory is only created once something is cached
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_open(self._path(key, suffix), 'wb') as file:
+            file.write(data)
+        self.evict()
+
+    def get_text(self, key):
+        data = self._read(key, ".json")
+        return None if data is None else json.loads(data.decode("utf-8"))["text"]
+
+    def put_text(self, key, text):
+        self._write(key, ".json", json.dumps({"text": text}, ensure_ascii=False).encode("utf-8"))
+
+    def get_bytes(self, key):
+        return self._read(key, ".bin")
+
+    def put_bytes(self, key, data):
+        self._write(key, ".bin", data)
+
+    def evict(self):
+        """Drop expired entries, then the oldest ones until the cache fits in max_bytes."""
+        now = time.time()
+        entries = []
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(path)
+                if self.max_age is not None and now - stat.st_mtime > self.max_age:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                # Another album removed it in the meantime
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -1,48 +1,126 @@
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from downloadsong import download_mp3
+from tracing import count
 
 base_url = 'http://localhost:3000'
 
+# (connect, read) timeouts in seconds for every Suno request
+DEFAULT_TIMEOUT = (5, 30)
+
+
+def _never_sent(error):
+    """True if a request failed before it reached the server, so even a POST can be sent again."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class SunoClient:
+    """Synchronous Suno API client that reuses one pooled session for every request."""
+
+    def __init__(self, base_url=base_url, timeout=DEFAULT_TIMEOUT, max_retries=3, backoff=1.0, pool_size=16):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request, retrying with exponential backoff. GETs are retried on 5xx responses,
+        timeouts and connection errors. POSTs start (and charge for) a generation, so they are
+        only retried when the connection could not be made; a POST the server may have
+        accepted is never sent twice.
+        """
+        url = f"{self.base_url}{path}"
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            count('suno_calls')
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code < 500:
+                    return response.json()
+                error = f"status code {response.status_code}"
+                retriable = method == 'GET'
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                retriable = method == 'GET' or _never_sent(e)
+
+            if not retriable:
+                raise Exception(f"Request to {path} failed: {error}")
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff * (2 ** attempt)
+            print(f"Request to {path} failed ({error}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+        raise Exception(f"Request to {path} failed after {self.max_retries + 1} attempts: {error}")
+
+    def custom_generate_audio(self, payload):
+        return self.request('POST', '/api/custom_generate', json=payload)
+
+    def extend_audio(self, payload):
+        return self.request('POST', '/api/extend_audio', json=payload)
+
+    def generate_audio_by_prompt(self, payload):
+        return self.request('POST', '/api/generate', json=payload)
+
+    def get_audio_information(self, audio_ids):
+        return self.request('GET', f'/api/get?ids={audio_ids}')
+
+    def get_quota_information(self):
+        return self.request('GET', '/api/get_limit')
+
+    def get_clip(self, clip_id):
+        return self.request('GET', f'/api/clip?id={clip_id}')
+
+    def generate_whole_song(self, clip_id, payload):
+        return self.request('POST', '/api/concat', json=payload)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+
+
+def get_client():
+    """Return the shared SunoClient used by the module-level helpers."""
+    global _client
+    if _client is None:
+        _client = SunoClient(base_url=base_url)
+    return _client
+
 
 def custom_generate_audio(payload):
-    url = f"{base_url}/api/custom_generate"
-    response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
-    return response.json()
+    return get_client().custom_generate_audio(payload)
 
 
 def extend_audio(payload):
-    url = f"{base_url}/api/extend_audio"
-    response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
-    return response.json()
+    return get_client().extend_audio(payload)
 
 def generate_audio_by_prompt(payload):
-    url = f"{base_url}/api/generate"
-    response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
-    return response.json()
+    return get_client().generate_audio_by_prompt(payload)
 
 
 def get_audio_information(audio_ids):
-    url = f"{base_url}/api/get?ids={audio_ids}"
-    response = requests.get(url)
-    return response.json()
+    return get_client().get_audio_information(audio_ids)
 
 
 def get_quota_information():
-    url = f"{base_url}/api/get_limit"
-    response = requests.get(url)
-    return response.json()
+    return get_client().get_quota_information()
 
 def get_clip(clip_id):
-    url = f"{base_url}/api/clip?id={clip_id}"
-    response = requests.get(url)
-    return response.json()
+    return get_client().get_clip(clip_id)
 
 def generate_whole_song(clip_id, payload):
-    payloyd = {"clip_id": clip_id}
-    url = f"{base_url}/api/concat"
-    response = requests.post(url, json=payload)
-    return response.json()
+    return get_client().generate_whole_song(clip_id, payload)
 
 
 if __name__ == '__main__':
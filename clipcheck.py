@@ -0,0 +1,291 @@
+import os
+import threading
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from atomicfile import atomic_open
+
+# Clips are analysed as mono PCM at a quarter of the CD rate, which keeps everything up to 5.5 kHz
+ANALYSIS_RATE = 11025
+
+# Loudness of 100 ms frames decides what counts as silence
+LEVEL_SECONDS = 0.1
+SILENCE_THRESHOLD = -50.0  # dBFS
+KEEP_SILENCE = 0.5         # seconds of silence left at either end when trimming
+MAX_SILENT_GAP = 8.0       # clips with a longer silence in the middle are dropped
+MAX_CLIPPED_FRACTION = 0.005
+
+# Fingerprints: one 16-bit word per 50 ms, from 17 log-spaced bands between 150 Hz and 5 kHz
+FINGERPRINT_HOP = 0.05
+FFT_SIZE = 4096  # 370 ms windows overlap enough that clips a fraction of a hop apart still agree
+BANDS = 17
+LOW_FREQUENCY = 150.0
+HIGH_FREQUENCY = 5000.0
+FINGERPRINT_SECONDS = 60   # compared over the first minute of every clip
+MAX_SHIFT_SECONDS = 2.0    # clips may start up to this much apart and still match
+PROBE_SECONDS = 10.0       # finds each indexed clip's best shift before the full comparison
+MIN_OVERLAP_SECONDS = 10.0
+DUPLICATE_BIT_ERROR = 0.3  # unrelated clips disagree on about half the bits
+PROBE_BIT_ERROR = 0.4      # probes closer than this are compared in full
+
+# Clips (often memory-mapped) are read this many seconds at a time, so no full-length copy is made
+ANALYSIS_CHUNK_SECONDS = 10
+
+FULL_SCALE = 32768.0
+
+# Number of bits set in every 16-bit value, so a fingerprint word is compared with one lookup
+_POPCOUNT = np.unpackbits(np.arange(65536, dtype=np.uint16).view(np.uint8)).reshape(-1, 16).sum(axis=1)
+_POPCOUNT = _POPCOUNT.astype(np.uint8)
+
+
+def _band_matrix():
+    """(FFT bins, BANDS) matrix that sums power spectrum bins into log-spaced bands."""
+    frequencies = np.fft.rfftfreq(FFT_SIZE, 1 / ANALYSIS_RATE)
+    edges = np.geomspace(LOW_FREQUENCY, HIGH_FREQUENCY, BANDS + 1)
+    band = np.searchsorted(edges, frequencies, side='right') - 1
+    matrix = np.zeros((len(frequencies), BANDS), dtype=np.float32)
+    inside = (band >= 0) & (band < BANDS)
+    matrix[np.nonzero(inside)[0], band[inside]] = 1
+    return matrix
+
+
+_BAND_MATRIX = _band_matrix()
+_WINDOW = np.hanning(FFT_SIZE).astype(np.float32)
+
+
+def downsample(samples, frame_rate=44100, chunk_seconds=ANALYSIS_CHUNK_SECONDS):
+    """
+    Mono float32 PCM at about ANALYSIS_RATE, averaging channels and neighbouring frames.
+    Works through the samples chunk_seconds at a time, so only one chunk is ever converted.
+    """
+    factor = max(int(round(frame_rate / ANALYSIS_RATE)), 1)
+    channels = samples.shape[1] if samples.ndim > 1 else 1
+    # Dot with a vector of weights instead of .mean(), which would make a float64 copy first
+    weights = np.full(factor * channels, 1 / (factor * channels * FULL_SCALE), dtype=np.float32)
+    mono = np.empty(len(samples) // factor, dtype=np.float32)
+    step = int(chunk_seconds * frame_rate) // factor * factor
+    for start in range(0, len(mono) * factor, step):
+        stop = min(start + step, len(mono) * factor)
+        blocks = samples[start:stop].reshape((stop - start) // factor, factor * channels)
+        mono[start // factor:stop // factor] = blocks.astype(np.float32) @ weights
+    return mono, frame_rate / factor
+
+
+def count_clipped(samples, frame_rate=44100, chunk_seconds=ANALYSIS_CHUNK_SECONDS):
+    """Number of samples at full scale, counted a chunk at a time."""
+    step = int(chunk_seconds * frame_rate)
+    clipped = 0
+    for start in range(0, len(samples), step):
+        chunk = samples[start:start + step]
+        clipped += np.count_nonzero(chunk >= 32767) + np.count_nonzero(chunk <= -32768)
+    return clipped
+
+
+def frame_levels(mono, rate):
+    """Level of every LEVEL_SECONDS frame of mono PCM, in dBFS."""
+    step = max(int(LEVEL_SECONDS * rate), 1)
+    frames = mono[:len(mono) // step * step].reshape(-1, step)
+    power = np.einsum('ij,ij->i', frames, frames) / step
+    return 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def _silent_runs(silent):
+    """(start, stop) frame ranges of every run of True values."""
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    return list(zip(np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]))
+
+
+def spectral_fingerprint(mono, rate):
+    """
+    uint16 fingerprint of mono PCM, one word per FINGERPRINT_HOP seconds.
+
+    Every bit is the sign of the change over time of the energy difference between two
+    neighbouring bands, so it survives level changes, re-encoding and small EQ changes.
+    """
+    hop = max(int(FINGERPRINT_HOP * rate), 1)
+    if len(mono) < FFT_SIZE + hop:
+        return np.zeros(0, dtype=np.uint16)
+    frames = sliding_window_view(mono, FFT_SIZE)[::hop]
+    energies = np.empty((len(frames), BANDS), dtype=np.float32)
+    # A couple of hundred windows per FFT keeps the complex spectra to a few megabytes
+    for start in range(0, len(frames), 200):
+        power = np.abs(np.fft.rfft(frames[start:start + 200] * _WINDOW, axis=1)) ** 2
+        energies[start:start + 200] = np.log(power.astype(np.float32) @ _BAND_MATRIX + 1e-9)
+    band_differences = np.diff(energies, axis=1)
+    bits = np.diff(band_differences, axis=0) > 0
+    return np.packbits(bits, axis=1).view('>u2').ravel().astype(np.uint16)
+
+
+def _bit_error(fingerprint, other, shift, min_overlap):
+    """Bit error rate with frame i of fingerprint lined up with frame i + shift of other."""
+    start = max(0, -shift)
+    stop = min(len(fingerprint), len(other) - shift)
+    if stop - start < min_overlap:
+        return 1.0
+    errors = _POPCOUNT[fingerprint[start:stop] ^ other[start + shift:stop + shift]].sum(dtype=np.int64)
+    return float(errors) / ((stop - start) * 16)
+
+
+def bit_errors(fingerprint, others, max_shift=int(MAX_SHIFT_SECONDS / FINGERPRINT_HOP),
+               probe=int(PROBE_SECONDS / FINGERPRINT_HOP), min_overlap=int(MIN_OVERLAP_SECONDS / FINGERPRINT_HOP)):
+    """
+    Lowest bit error rate between a fingerprint and each of a list of others, over every
+    shift of up to max_shift frames. A short probe from the fingerprint is first slid over
+    all the others at once; only others that come close are then compared in full, at
+    their best shift. Returns one rate per fingerprint in others.
+    """
+    rates = np.ones(len(others))
+    shifts = np.zeros(len(others), dtype=int)
+    span = 2 * max_shift + probe
+    probed = np.array([len(fingerprint) >= span and len(other) >= span for other in others], dtype=bool)
+
+    if probed.any():
+        windows = np.stack([other[:span] for other, ok in zip(others, probed) if ok])
+        # (others, shifts, probe) views of every shifted window, compared with one lookup per word
+        views = sliding_window_view(windows, probe, axis=1)
+        errors = _POPCOUNT[views ^ fingerprint[max_shift:max_shift + probe]].sum(axis=2, dtype=np.int32)
+        best = errors.argmin(axis=1)
+        shifts[probed] = best - max_shift
+        rates[probed] = errors[np.arange(len(best)), best] / (probe * 16)
+
+    for i, other in enumerate(others):
+        if not probed[i]:
+            # Too short to probe: try every shift
+            rates[i] = min(_bit_error(fingerprint, other, shift, min_overlap)
+                           for shift in range(-max_shift, max_shift + 1))
+        elif rates[i] < PROBE_BIT_ERROR:
+            rates[i] = _bit_error(fingerprint, other, int(shifts[i]), min_overlap)
+    return rates
+
+
+class FingerprintIndex:
+    """
+    On-disk index of the fingerprints of clips kept in past and current albums.
+
+    Every clip is one small .npy file in directory, so albums running in other threads or
+    processes see each other's clips on their next lookup. Only the most recent max_entries
+    clips are kept.
+    """
+
+    def __init__(self, directory=".cache/fingerprints", max_entries=2000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if not os.path.isdir(self.directory):
+            return
+        names = {filename[:-4] for filename in os.listdir(self.directory) if filename.endswith(".npy")}
+        for clip_id in set(self._fingerprints) - names:
+            del self._fingerprints[clip_id]
+        for clip_id in names - set(self._fingerprints):
+            try:
+                self._fingerprints[clip_id] = np.load(os.path.join(self.directory, f"{clip_id}.npy"))
+            except (OSError, ValueError):
+                # Removed or still being written by another album
+                continue
+
+    def match(self, clip_id, fingerprint):
+        """Return (clip ID, bit error rate) of the closest other clip, or (None, 1.0)."""
+        with self._lock:
+            self._refresh()
+            candidates = [(other_id, other) for other_id, other in self._fingerprints.items()
+                          if other_id != clip_id and len(other)]
+        if not candidates:
+            return None, 1.0
+        rates = bit_errors(fingerprint, [other for _, other in candidates])
+        best = int(np.argmin(rates))
+        return candidates[best][0], float(rates[best])
+
+    def add(self, clip_id, fingerprint):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with atomic_open(os.path.join(self.directory, f"{clip_id}.npy"), 'wb') as file:
+                np.save(file, fingerprint)
+            self._fingerprints[clip_id] = fingerprint
+            self._evict()
+
+    def _evict(self):
+        filenames = [filename for filename in os.listdir(self.directory) if filename.endswith(".npy")]
+        if len(filenames) <= self.max_entries:
+            return
+        paths = sorted((os.path.join(self.directory, filename) for filename in filenames), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def analyze(samples, frame_rate=44100):
+    """
+    Silence, clipping and fingerprint statistics of an int16 (frames, channels) clip.
+
+    Returns a dict with the clip's duration, the seconds of silence at its start and end,
+    its longest silence in between, the fraction of samples at full scale and its
+    fingerprint (taken from the first sound, so leading silence doesn't shift it).
+    """
+    clipped = count_clipped(samples, frame_rate)
+    mono, rate = downsample(samples, frame_rate)
+    silent = frame_levels(mono, rate) < SILENCE_THRESHOLD
+    runs = _silent_runs(silent)
+
+    leading = runs[0][1] if runs and runs[0][0] == 0 else 0
+    trailing = len(silent) - runs[-1][0] if runs and runs[-1][1] == len(silent) else 0
+    if leading == len(silent):
+        trailing = 0
+    inner = [stop - start for start, stop in runs if start > 0 and stop < len(silent)]
+
+    step = int(LEVEL_SECONDS * rate)
+    first = leading * step
+    return {
+        "duration": len(samples) / frame_rate,
+        "leading_silence": round(float(leading * LEVEL_SECONDS), 1),
+        "trailing_silence": round(float(trailing * LEVEL_SECONDS), 1),
+        "longest_gap": round(float(max(inner, default=0) * LEVEL_SECONDS), 1),
+        "clipped_fraction": float(clipped / max(samples.size, 1)),
+        "fingerprint": spectral_fingerprint(mono[first:first + int(FINGERPRINT_SECONDS * rate)], rate),
+    }
+
+
+class ClipChecker:
+    """
+    Quality gate for songs between decoding and mixing.
+
+    check() drops clips that are mostly silent, have a long silence in the middle, are
+    heavily clipped or sound like a clip already kept in this or a past album, and trims
+    long silence from the start and end of the rest. Kept clips are added to the index.
+    """
+
+    def __init__(self, index=None, min_duration=30, frame_rate=44100):
+        self.index = index or FingerprintIndex()
+        self.min_duration = min_duration
+        self.frame_rate = frame_rate
+        self.reports = {}
+
+    def check(self, audio_file, samples):
+        """Return (trimmed samples, report), or (None, report) with the reason in report['rejected']."""
+        clip_id = os.path.basename(audio_file).replace('_song.mp3', '')
+        report = analyze(samples, self.frame_rate)
+        self.reports[clip_id] = report
+
+        start = max(report["leading_silence"] - KEEP_SILENCE, 0)
+        stop = report["duration"] - max(report["trailing_silence"] - KEEP_SILENCE, 0)
+        report["trimmed"] = round(float(start + report["duration"] - stop), 1)
+
+        if stop - start < self.min_duration:
+            report["rejected"] = f"only {stop - start:.0f}s of sound"
+        elif report["longest_gap"] > MAX_SILENT_GAP:
+            report["rejected"] = f"{report['longest_gap']:.0f}s of silence in the middle"
+        elif report["clipped_fraction"] > MAX_CLIPPED_FRACTION:
+            report["rejected"] = f"{report['clipped_fraction']:.1%} of samples clipped"
+        else:
+            match, bit_error = self.index.match(clip_id, report["fingerprint"])
+            report["closest_match"] = (match, round(bit_error, 3))
+            if bit_error < DUPLICATE_BIT_ERROR:
+                report["rejected"] = f"sounds like clip {match} (bit error rate {bit_error:.2f})"
+
+        if report.get("rejected"):
+            return None, report
+        self.index.add(clip_id, report["fingerprint"])
+        return samples[int(start * self.frame_rate):int(stop * self.frame_rate)], report
@@ -0,0 +1,155 @@
+import io
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+INDEX_PATH = "cover_hashes.db"
+
+# Where the index was kept before it moved to SQLite; imported on first use
+LEGACY_INDEX_PATH = "cover_hashes.json"
+
+# Covers are compared as 64-bit DCT hashes: the 8x8 lowest frequencies of a 32x32 grayscale thumbnail
+HASH_SIZE = 8
+SAMPLE_SIZE = 32
+
+# Hashes this many bits apart (out of 64) or closer are treated as the same picture
+DUPLICATE_DISTANCE = 10
+
+# Number of bits set in every byte value, for counting differing bits a byte at a time
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II matrix, so dct(x) is matrix @ x @ matrix.T for a square x."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(SAMPLE_SIZE)
+
+
+def _thumbnail(image):
+    """Grayscale SAMPLE_SIZE x SAMPLE_SIZE pixels of a PIL image, image bytes or a path."""
+    from PIL import Image
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    elif isinstance(image, str):
+        image = Image.open(image)
+    # reducing_gap shrinks by whole factors first, which is much faster on 1024px covers
+    thumbnail = image.convert("L").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.LANCZOS, reducing_gap=2.0)
+    return np.asarray(thumbnail, dtype=np.float32)
+
+
+def perceptual_hashes(images):
+    """
+    64-bit perceptual hashes of several images at once, as Python ints.
+
+    Every image is shrunk to a 32x32 grayscale thumbnail; the DCT of the whole stack is
+    taken in one pair of matrix products and each bit says whether one of the 64 lowest
+    frequencies is above that image's median. Small edits, recompression and resizing
+    change only a few bits, while different pictures differ in about half of them.
+    """
+    pixels = np.stack([_thumbnail(image) for image in images])
+    frequencies = np.einsum('ij,njk,lk->nil', _DCT, pixels, _DCT)[:, :HASH_SIZE, :HASH_SIZE]
+    frequencies = frequencies.reshape(len(pixels), -1)
+    # The DC term is just the average brightness, so it is left out of the median
+    medians = np.median(frequencies[:, 1:], axis=1, keepdims=True)
+    bits = np.packbits(frequencies > medians, axis=1)
+    return [int.from_bytes(row.tobytes(), 'big') for row in bits]
+
+
+def hamming_distances(hashes, others):
+    """Matrix of differing bits between every hash in hashes and every hash in others."""
+    left = np.array(hashes, dtype=np.uint64)[:, None]
+    right = np.array(others, dtype=np.uint64)[None, :]
+    differing = np.bitwise_xor(left, right)
+    return _POPCOUNT[differing.view(np.uint8).reshape(differing.shape + (8,))].sum(axis=-1)
+
+
+class CoverIndex:
+    """
+    Persistent record of the perceptual hashes of past album covers.
+
+    Entries are rows of a small SQLite database, so every process producing albums (a daemon,
+    a CLI run next to it) reads and adds to the same index instead of overwriting each
+    other's copy. Only the most recent ones are compared against, so a look can come back
+    after enough albums. A cover_hashes.json left by older versions is imported once.
+    """
+
+    def __init__(self, path=INDEX_PATH, recent=100, max_entries=5000, legacy_path=LEGACY_INDEX_PATH):
+        self.path = path
+        self.recent = recent
+        self.max_entries = max_entries
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS covers (id INTEGER PRIMARY KEY AUTOINCREMENT, hash TEXT NOT NULL, "
+                "info TEXT NOT NULL, added TEXT NOT NULL)"
+            )
+        if legacy_path and os.path.exists(legacy_path):
+            self._import(legacy_path)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _import(self, legacy_path):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have imported (and renamed) it first
+                with open(legacy_path, 'r', encoding='utf-8') as file:
+                    entries = json.load(file)
+            except FileNotFoundError:
+                connection.execute("ROLLBACK")
+                return
+            for entry in entries:
+                info = {key: value for key, value in entry.items() if key not in ("hash", "added")}
+                connection.execute("INSERT INTO covers (hash, info, added) VALUES (?, ?, ?)",
+                                   (entry["hash"], json.dumps(info), entry.get("added", "")))
+            os.replace(legacy_path, f"{legacy_path}.imported")
+            connection.execute("COMMIT")
+        print(f"Imported {len(entries)} cover hashes from {legacy_path} into {self.path}.")
+
+    def recent_hashes(self):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT hash FROM covers ORDER BY id DESC LIMIT ?", (self.recent,))
+            return [int(cover_hash, 16) for cover_hash, in rows]
+
+    def distances(self, hashes):
+        """For each hash, the distance in bits to the closest recent cover (64 if there are none)."""
+        recent = self.recent_hashes()
+        if not recent:
+            return [HASH_SIZE * HASH_SIZE] * len(hashes)
+        return [int(distance) for distance in hamming_distances(hashes, recent).min(axis=1)]
+
+    def pick(self, hashes):
+        """Return (position, distance) of the hash least like any recent cover."""
+        distances = self.distances(hashes)
+        best = max(range(len(hashes)), key=lambda i: distances[i])
+        return best, distances[best]
+
+    def add(self, cover_hash, **info):
+        """Record a cover's hash along with any details worth keeping (job, path, prompt)."""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("INSERT INTO covers (hash, info, added) VALUES (?, ?, ?)",
+                               (f"{cover_hash:016x}", json.dumps(info, default=str),
+                                datetime.now().isoformat(timespec="seconds")))
+            connection.execute("DELETE FROM covers WHERE id <= (SELECT MAX(id) FROM covers) - ?",
+                               (self.max_entries,))
+            connection.execute("COMMIT")
+
+    def stats(self):
+        with self._connect() as connection:
+            return {"covers": connection.execute("SELECT COUNT(*) FROM covers").fetchone()[0]}
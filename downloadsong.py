@@ -1,21 +1,121 @@
+import os
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from tracing import count, propagate
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_TIMEOUT = (5, 60)
+
+# One pooled session shared by every download
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+session.mount('http://', _adapter)
+session.mount('https://', _adapter)
+
+
+class DownloadError(Exception):
+    """A download that could not be completed. Carries the URL, target path and HTTP status if any."""
+
+    def __init__(self, url, output_path, reason, status_code=None):
+        super().__init__(f"Failed to download {url} to {output_path}: {reason}")
+        self.url = url
+        self.output_path = output_path
+        self.reason = reason
+        self.status_code = status_code
+
+
+def looks_like_mp3(path):
+    """Check that a file starts with an ID3 tag or an MPEG audio frame sync."""
+    with open(path, 'rb') as file:
+        head = file.read(3)
+    return head[:3] == b'ID3' or (len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0)
+
+
+def _expected_size(response, offset):
+    """Total size of the file from Content-Range/Content-Length, or None if the server doesn't say."""
+    content_range = response.headers.get('Content-Range')
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    content_length = response.headers.get('Content-Length')
+    if content_length is None:
+        return None
+    return int(content_length) + (offset if response.status_code == 206 else 0)
+
+
+def download_mp3(url, output_path, retries=3, chunk_size=CHUNK_SIZE, timeout=DEFAULT_TIMEOUT):
+    """
+    Download an MP3 to output_path and return the path.
+
+    Data is written to output_path + '.part' and renamed into place only after the size
+    and MP3 header have been checked. Interrupted downloads resume from the partial file
+    with an HTTP Range request. Raises DownloadError if the file cannot be fetched.
+    """
+    part_path = f"{output_path}.part"
+    last_error = None
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
 
-def download_mp3(url, output_path, retries=3):
     for attempt in range(retries):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
         try:
-            response = requests.get(url, stream=True)
-            if response.status_code == 200:
-                with open(output_path, 'wb') as file:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:
-                            file.write(chunk)
-                print(f"Download complete: {output_path}")
-                return
-            else:
-                print(f"Failed to download file. Status code: {response.status_code}")
-                break  # Exit if the response status is not 200
-        except requests.exceptions.ChunkedEncodingError as e:
-            print(f"Attempt {attempt + 1} failed due to chunked encoding error. Retrying...")
-            time.sleep(1)
-    print(f"Failed to download {url} after {retries} attempts.")
\ No newline at end of file
+            with session.get(url, stream=True, timeout=timeout, headers=headers) as response:
+                if response.status_code == 416 and offset:
+                    # Nothing left to fetch: the partial file may already be complete
+                    expected = offset
+                elif response.status_code in (200, 206):
+                    if response.status_code == 200:
+                        offset = 0  # The server ignored the Range header; start over
+                    expected = _expected_size(response, offset)
+                    with open(part_path, 'ab' if offset else 'wb') as file:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if chunk:
+                                file.write(chunk)
+                                count('bytes_downloaded', len(chunk))
+                elif response.status_code >= 500:
+                    last_error = DownloadError(url, output_path, "server error", response.status_code)
+                    print(f"Attempt {attempt + 1} failed with status code {response.status_code}. Retrying...")
+                    time.sleep(2 ** attempt)
+                    continue
+                else:
+                    raise DownloadError(url, output_path, "unexpected status", response.status_code)
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            last_error = DownloadError(url, output_path, str(e))
+            print(f"Attempt {attempt + 1} failed ({e.__class__.__name__}). Resuming...")
+            time.sleep(2 ** attempt)
+            continue
+
+        size = os.path.getsize(part_path)
+        if expected is not None and size != expected:
+            last_error = DownloadError(url, output_path, f"got {size} of {expected} bytes")
+            print(f"Attempt {attempt + 1} ended early ({size}/{expected} bytes). Resuming...")
+            continue
+        if size == 0 or not looks_like_mp3(part_path):
+            os.remove(part_path)
+            raise DownloadError(url, output_path, "response is not an MP3 file")
+
+        os.replace(part_path, output_path)
+        count('downloads')
+        print(f"Download complete: {output_path}")
+        return output_path
+
+    raise last_error or DownloadError(url, output_path, f"gave up after {retries} attempts")
+
+
+def download_many(downloads, max_workers=4, **options):
+    """
+    Download several (url, output_path) pairs at once over the shared session.
+    Returns (paths, errors): the paths that succeeded and a DownloadError for each failure.
+    """
+    paths, errors = [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(propagate(download_mp3), url, output_path, **options) for url, output_path in downloads]
+        for future in futures:
+            try:
+                paths.append(future.result())
+            except DownloadError as e:
+                errors.append(e)
+    return paths, errors
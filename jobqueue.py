@@ -0,0 +1,248 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+QUEUE_DB = "album_queue.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS albums (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    description TEXT NOT NULL,
+    cover_description TEXT NOT NULL,
+    iterations INTEGER NOT NULL,
+    tags TEXT NOT NULL,
+    privacy TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    job_dir TEXT,
+    video_id TEXT,
+    error TEXT,
+    timings TEXT,
+    queued TEXT NOT NULL,
+    started TEXT,
+    finished TEXT
+)
+"""
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class JobQueue:
+    """
+    Durable queue of album specs in a local SQLite file, shared by any number of workers.
+
+    A worker leases the oldest album that is due and keeps the lease alive with heartbeats;
+    a lease that isn't renewed in time (the worker crashed or the machine rebooted) expires
+    and the album goes to the next worker, which resumes it from its job directory. A failed
+    album is retried after an exponentially growing delay, up to max_attempts, and skips the
+    stages it already finished. Every call uses its own connection, so workers can be
+    threads, processes or separate runs of the program.
+    """
+
+    def __init__(self, path=QUEUE_DB, lease_seconds=300, max_attempts=4, retry_delay=60, max_retry_delay=3600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        with self._connect() as connection:
+            # WAL lets the status command read while a worker is writing
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't lease the same album
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    @staticmethod
+    def _entry(row):
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["tags"] = json.loads(entry["tags"])
+        entry["timings"] = json.loads(entry["timings"]) if entry["timings"] else None
+        return entry
+
+    def enqueue(self, description, cover_description, iterations=9, tags=(), privacy='public'):
+        """Add an album spec to the queue. Returns its id."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO albums (description, cover_description, iterations, tags, privacy, queued) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (description, cover_description, iterations, json.dumps(list(tags)), privacy, _now())
+            )
+            return cursor.lastrowid
+
+    def lease(self, worker):
+        """Lease the oldest album that is due (or whose lease expired) to worker, or return None."""
+        now = time.time()
+        with self._transaction() as connection:
+            # An album whose worker keeps dying is given up on instead of being leased forever
+            connection.execute(
+                "UPDATE albums SET status = 'failed', error = 'lease expired', worker = NULL, finished = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (_now(), now, self.max_attempts)
+            )
+            row = connection.execute(
+                "SELECT * FROM albums WHERE (status = 'queued' AND not_before <= ?) "
+                "OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["status"] == 'leased':
+                print(f"Lease of album {row['id']} held by {row['worker']} expired, taking it over.")
+            connection.execute(
+                "UPDATE albums SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?) WHERE id = ?",
+                (worker, now + self.lease_seconds, _now(), row["id"])
+            )
+            return self._entry(connection.execute("SELECT * FROM albums WHERE id = ?", (row["id"],)).fetchone())
+
+    def heartbeat(self, album_id, worker):
+        """Extend worker's lease on an album. Returns False if the lease has been lost."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE albums SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, album_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    @contextmanager
+    def keep_leased(self, album_id, worker, on_lost, interval=None):
+        """
+        Send heartbeats for an album from a background thread while the block runs. If the
+        lease is lost, on_lost() is called once so the worker can stop before another worker
+        that took the album over starts writing to the same job directory.
+        """
+        interval = interval or self.lease_seconds / 3
+        stopped = threading.Event()
+
+        def beat():
+            while not stopped.wait(interval):
+                try:
+                    if not self.heartbeat(album_id, worker):
+                        print(f"Lost the lease on album {album_id}; stopping it.")
+                        on_lost()
+                        return
+                except sqlite3.Error as e:
+                    print(f"Heartbeat for album {album_id} failed: {e}")
+
+        thread = threading.Thread(target=beat, name=f"heartbeat-{album_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def set_job_dir(self, album_id, worker, job_dir):
+        """
+        Remember the album's job directory, so a retry or another worker resumes it.
+        Returns False if worker no longer holds the lease.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute("UPDATE albums SET job_dir = ? WHERE id = ? AND worker = ?",
+                                        (job_dir, album_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, album_id, worker, timings=None, video_id=None):
+        """
+        Mark an album done, with the seconds spent in each stage. Returns False (and
+        changes nothing) if worker no longer holds the lease.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE albums SET status = 'done', worker = NULL, lease_expires = NULL, error = NULL, "
+                "video_id = ?, timings = ?, finished = ? WHERE id = ? AND worker = ?",
+                (video_id, json.dumps(timings or {}), _now(), album_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, album_id, worker, error):
+        """Record a failed attempt: retry later with backoff, or give up after max_attempts."""
+        with self._transaction() as connection:
+            row = connection.execute("SELECT attempts FROM albums WHERE id = ? AND worker = ?",
+                                     (album_id, worker)).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] < self.max_attempts:
+                delay = min(self.retry_delay * 2 ** (row["attempts"] - 1), self.max_retry_delay)
+                connection.execute(
+                    "UPDATE albums SET status = 'queued', worker = NULL, lease_expires = NULL, error = ?, "
+                    "not_before = ? WHERE id = ?",
+                    (error, time.time() + delay, album_id)
+                )
+                print(f"Album {album_id} failed (attempt {row['attempts']}), retrying in {delay:.0f}s: {error}")
+                return delay
+            connection.execute(
+                "UPDATE albums SET status = 'failed', worker = NULL, lease_expires = NULL, error = ?, finished = ? "
+                "WHERE id = ?",
+                (error, _now(), album_id)
+            )
+            print(f"Album {album_id} failed {row['attempts']} times, giving up: {error}")
+            return None
+
+    def release(self, album_id, worker):
+        """Hand a leased album back without counting the attempt, e.g. when a worker shuts down."""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE albums SET status = 'queued', worker = NULL, lease_expires = NULL, "
+                "attempts = MAX(attempts - 1, 0) WHERE id = ? AND worker = ? AND status = 'leased'",
+                (album_id, worker)
+            )
+
+    def requeue(self, album_id):
+        """Put a failed album back in the queue with a fresh set of attempts."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE albums SET status = 'queued', attempts = 0, not_before = 0, finished = NULL "
+                "WHERE id = ? AND status = 'failed'",
+                (album_id,)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, album_id):
+        with self._connect() as connection:
+            return self._entry(connection.execute("SELECT * FROM albums WHERE id = ?", (album_id,)).fetchone())
+
+    def entries(self, status=None, limit=20):
+        """The most recent entries, newest first, optionally only those with a given status."""
+        with self._connect() as connection:
+            if status is None:
+                rows = connection.execute("SELECT * FROM albums ORDER BY id DESC LIMIT ?", (limit,))
+            else:
+                rows = connection.execute("SELECT * FROM albums WHERE status = ? ORDER BY id DESC LIMIT ?",
+                                          (status, limit))
+            return [self._entry(row) for row in rows]
+
+    def status(self):
+        """Counts of albums by status."""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM albums GROUP BY status")
+            return {status: number for status, number in rows}
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from atomicfile import write_json
+
+JOBS_ROOT = "jobs"
+
+
+def file_hash(path):
+    """SHA-256 of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JobCancelled(Exception):
+    """Raised by a job's manifest updates once the job has been cancelled (e.g. its lease was lost)."""
+
+
+class AlbumJob:
+    """
+    One album's working directory plus a manifest.json recording what has been produced.
+
+    Each stage stores its outputs and the content hashes of the files it wrote, so a
+    resumed job can skip every stage whose files are still intact. Suno clips are tracked
+    individually from submission to download, so clips that were submitted but never
+    downloaded can be polled again instead of regenerated. Stages running on other threads
+    update the manifest through a lock, so saves never interleave.
+    """
+
+    def __init__(self, job_dir, manifest):
+        self.job_dir = job_dir
+        self.manifest = manifest
+        # Reentrant, since the updating methods hold it while they call save()
+        self._lock = threading.RLock()
+        self.cancelled = None
+
+    @classmethod
+    def create(cls, params, root=JOBS_ROOT):
+        job_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        job_dir = os.path.join(root, job_id)
+        for folder in ('songs', 'covers', 'audio', 'video'):
+            os.makedirs(os.path.join(job_dir, folder), exist_ok=True)
+        job = cls(job_dir, {"id": job_id, "params": params, "stages": {}, "clips": {}, "finished": False})
+        job.save()
+        return job
+
+    @classmethod
+    def load(cls, job_dir):
+        with open(os.path.join(job_dir, "manifest.json"), 'r', encoding='utf-8') as file:
+            return cls(job_dir, json.load(file))
+
+    @property
+    def id(self):
+        return self.manifest["id"]
+
+    @property
+    def params(self):
+        return self.manifest["params"]
+
+    def path(self, *parts):
+        """Path of a file inside the job directory."""
+        return os.path.join(self.job_dir, *parts)
+
+    def cancel(self, reason):
+        """Stop the job at its next manifest update; the thread running it gets JobCancelled."""
+        self.cancelled = reason
+
+    def save(self):
+        # Write to a temporary file first so a crash never leaves a truncated manifest
+        with self._lock:
+            if self.cancelled:
+                raise JobCancelled(f"Job {self.id} was cancelled: {self.cancelled}")
+            write_json(self.path("manifest.json"), self.manifest, indent=2)
+
+    def stage(self, name):
+        """Outputs of a completed stage whose files are unchanged, or None if it has to run (again)."""
+        with self._lock:
+            stage = self.manifest["stages"].get(name)
+            if stage is None:
+                return None
+            hashes = dict(stage["hashes"])
+        for path, digest in hashes.items():
+            if not os.path.exists(path) or file_hash(path) != digest:
+                print(f"Stage '{name}' of job {self.id} is stale ({path} missing or changed); rerunning it.")
+                return None
+        return stage["outputs"]
+
+    def complete(self, name, outputs, files=()):
+        """Record a stage's outputs and the hashes of the files it produced."""
+        # Hash outside the lock; it reads whole files
+        hashes = {path: file_hash(path) for path in files}
+        with self._lock:
+            self.manifest["stages"][name] = {
+                "outputs": outputs,
+                "hashes": hashes,
+                "completed": datetime.now().isoformat(timespec="seconds"),
+            }
+            self.save()
+        return outputs
+
+    def record_submitted(self, clip_ids, batch):
+        submitted = time.time()
+        with self._lock:
+            for clip_id in clip_ids:
+                self.manifest["clips"][clip_id] = {"batch": batch, "status": "submitted", "submitted": submitted}
+            self.save()
+
+    def record_downloaded(self, clip_id, path):
+        digest = file_hash(path)
+        with self._lock:
+            self.manifest["clips"][clip_id].update({"status": "downloaded", "path": path, "hash": digest})
+            self.save()
+
+    def downloaded_clips(self):
+        """Paths of clips already downloaded whose files are intact."""
+        paths = []
+        with self._lock:
+            for clip_id, clip in self.manifest["clips"].items():
+                if clip["status"] != "downloaded":
+                    continue
+                if os.path.exists(clip["path"]) and file_hash(clip["path"]) == clip["hash"]:
+                    paths.append(clip["path"])
+                else:
+                    # The file is gone or damaged; poll the clip again to re-download it
+                    clip["status"] = "submitted"
+        return paths
+
+    def pending_clips(self):
+        """
+        Clips that were submitted but never downloaded, mapped to the time.time() they were
+        submitted at (None for manifests written before submit times were recorded).
+        """
+        with self._lock:
+            return {clip_id: clip.get("submitted") for clip_id, clip in self.manifest["clips"].items()
+                    if clip["status"] == "submitted"}
+
+    def batches_submitted(self):
+        with self._lock:
+            return len({clip["batch"] for clip in self.manifest["clips"].values()})
+
+    def finish(self):
+        with self._lock:
+            self.manifest["finished"] = True
+            self.save()
+
+
+def unfinished_jobs(root=JOBS_ROOT):
+    """Load every job under root that has not finished, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    jobs = []
+    for job_id in sorted(os.listdir(root)):
+        job_dir = os.path.join(root, job_id)
+        if not os.path.exists(os.path.join(job_dir, "manifest.json")):
+            continue
+        job = AlbumJob.load(job_dir)
+        if not job.manifest["finished"]:
+            jobs.append(job)
+    return jobs
@@ -1,24 +1,59 @@
+import hashlib
+import io
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openai import OpenAI
 import requests
-from PIL import Image
+from cache import ResponseCache
+from ratelimit import openai_limits
+from tracing import count, propagate
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("API key not found. Please set the 'OPENAI_API_KEY' environment variable.")
-
-# Instantiate the OpenAI client
-client = OpenAI(api_key=api_key)
+# The OpenAI client is created on first use, so importing this module needs neither the SDK nor a key
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("API key not found. Please set the 'OPENAI_API_KEY' environment variable.")
+        from openai import OpenAI
+        _client = OpenAI(api_key=api_key)
+    return _client
+
+# Pooled HTTP session for downloading generated images
+session = requests.Session()
+DOWNLOAD_TIMEOUT = (5, 60)
+
+# On-disk cache of chat completions and generated images, so retries and restarts don't pay twice
+cache = ResponseCache()
+
+# Function to run a chat completion through the cache. With parse, the parsed content is
+# returned and a reply is only cached if parse accepts it. fresh asks for a new reply even
+# if one is cached (it then replaces the cached one)
+def chat_completion(model, messages, parse=None, fresh=False, **params):
+    key = cache.key(kind="chat.completions", model=model, messages=messages, params=params)
+    content = None if fresh else cache.get_text(key)
+    if content is None:
+        openai_limits.before_request()
+        count('openai_calls')
+        raw_response = get_client().chat.completions.with_raw_response.create(model=model, messages=messages, **params)
+        openai_limits.update(raw_response.headers)
+        content = raw_response.parse().choices[0].message.content
+        parsed = parse(content) if parse else content
+        cache.put_text(key, content)
+        return parsed
+    return parse(content) if parse else content
 
 # Function to refine the image prompt using ChatGPT
-def refine_prompt(initial_prompt):
+def refine_prompt(initial_prompt, fresh=False):
     try:
-        response = client.chat.completions.create(
+        content = chat_completion(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are an assistant that specializes in refining image prompts for AI image generation. "
@@ -27,9 +62,10 @@ def refine_prompt(initial_prompt):
                                               "Please avoid any text or themes that could be perceived as sensitive or inappropriate. "
                                               "Make the prompt safe and clear and don't use copyrighted material. Keep your response very short and only include the new prompt in your response."},
                 {"role": "user", "content": initial_prompt}
-            ]
+            ],
+            fresh=fresh
         )
-        refined_prompt = response.choices[0].message.content.strip()
+        refined_prompt = content.strip()
         return refined_prompt
     except Exception as e:
         print(f"An error occurred in refine_prompt: {e}")
@@ -42,7 +78,7 @@ def generate_image(initial_prompt):
     
     try:
         # Generate the image using the refined prompt
-        response = client.images.generate(
+        response = get_client().images.generate(
             prompt=refined_prompt,
             n=1,
             size="1024x1024"
@@ -56,18 +92,49 @@ def generate_image(initial_prompt):
 
 # Function to save the image to the covers folder
 def save_image(image_url, file_path):
-    response = requests.get(image_url)
+    response = session.get(image_url, timeout=DOWNLOAD_TIMEOUT)
     if response.status_code == 200:
         with open(file_path, 'wb') as f:
             f.write(response.content)
     else:
         print("Failed to retrieve image")
 
+# Function to download generated image bytes over the shared session
+def download_bytes(url):
+    response = session.get(url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    count('bytes_downloaded', len(response.content))
+    return response.content
+
+# Function to generate several cover variants in one request; returns the image bytes of each.
+# A refined_prompt written ahead of time (by the previous album's metadata request) skips refine_prompt.
+# fresh generates new images (and a new refined prompt) even if this prompt's images are cached
+def generate_image_variants(initial_prompt, n=4, size="1024x1024", refined_prompt=None, fresh=False):
+    refined_prompt = refined_prompt or refine_prompt(initial_prompt, fresh=fresh)
+    keys = [cache.key(kind="images.generate", prompt=refined_prompt, n=n, size=size, variant=i) for i in range(n)]
+    variants = [None] * n if fresh else [cache.get_bytes(key) for key in keys]
+    if any(image_bytes is None for image_bytes in variants):
+        openai_limits.before_request()
+        count('openai_calls')
+        raw_response = get_client().images.with_raw_response.generate(
+            prompt=refined_prompt,
+            n=n,
+            size=size
+        )
+        openai_limits.update(raw_response.headers)
+        urls = [image["url"] for image in raw_response.parse().model_dump()["data"]]
+        # Fetch the variants at the same time; the URLs are only valid for a short while
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            variants = list(executor.map(propagate(download_bytes), urls))
+        for key, image_bytes in zip(keys, variants):
+            cache.put_bytes(key, image_bytes)
+    return variants
+
 # New function to generate a video title
 def generate_video_title(description, cover_description):
     try:
         prompt = f"'{description}', {cover_description}."
-        response = client.chat.completions.create(
+        content = chat_completion(
             model="gpt-4",
             messages=[
             {"role": "system", "content":   "You will create an album title based on the users provided details about the album. The title should be 1 word "
@@ -78,7 +145,7 @@ def generate_video_title(description, cover_description):
             {"role": "user", "content": prompt}
             ]
         )
-        title = response.choices[0].message.content.strip()
+        title = content.strip()
         return title
     except Exception as e:
         print(f"An error occurred in generate_video_title: {e}")
@@ -87,7 +154,7 @@ def generate_video_title(description, cover_description):
 def generate_video_description(description, title, timestamps_in_minutes):
     try:
         prompt = f"Title: '{title}'. Description:'{description}'. Timestamps: {timestamps_in_minutes}."
-        response = client.chat.completions.create(
+        content = chat_completion(
             model="gpt-4",
             messages=[
                 {"role": "system", "content":   "You will create a Youtube description for an album based on the details provided by the user."
@@ -101,7 +168,7 @@ def generate_video_description(description, title, timestamps_in_minutes):
                 {"role": "user", "content": prompt}
             ]
         )
-        video_description = response.choices[0].message.content.strip()
+        video_description = content.strip()
         return video_description
     except Exception as e:
         print(f"An error occurred in generate_video_description: {e}")
@@ -110,7 +177,7 @@ def generate_video_description(description, title, timestamps_in_minutes):
 def edit_description(description):
     try:
         prompt = f"Description: '{description}'."
-        response = client.chat.completions.create(
+        content = chat_completion(
             model="gpt-4",
             messages=[
                 {"role": "system", "content":   "You will slightly edit the music description the user provides. The larger program you are attatched to generates music albums on repeat. Your job is to alter the description "
@@ -122,16 +189,16 @@ def edit_description(description):
                 {"role": "user", "content": prompt}
             ]
         )
-        video_description = response.choices[0].message.content.strip()
+        video_description = content.strip()
         return video_description
     except Exception as e:
         print(f"An error occurred in generate_video_description: {e}")
         return None  # Or return a default description if needed
     
-def edit_cover_description(cover_description):
+def edit_cover_description(cover_description, fresh=False):
     try:
         prompt = f"Description: '{cover_description}'. Cover Description:'{cover_description}'."
-        response = client.chat.completions.create(
+        content = chat_completion(
             model="gpt-4",
             messages=[
                 {"role": "system", "content":   "You will edit the music album cover description the user provides. The larger program you are attatched to generates music album covers on repeat. Your job is to alter the description "
@@ -140,15 +207,140 @@ def edit_cover_description(cover_description):
                  "with anything except for the new cover description."},
 
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            fresh=fresh
         )
-        video_description = response.choices[0].message.content.strip()
+        video_description = content.strip()
         return video_description
     except Exception as e:
         print(f"An error occurred in generate_video_description: {e}")
         return None  # Or return a default description if needed
 
+# Faster model for the combined metadata request, which replaces four gpt-4 calls
+METADATA_MODEL = "gpt-4o-mini"
+
+# Structured output schema for the combined request; song_names is checked for length afterwards
+ALBUM_METADATA_SCHEMA = {
+    "name": "album_metadata",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "quote": {"type": "string"},
+            "song_names": {"type": "array", "items": {"type": "string"}},
+            "next_description": {"type": "string"},
+            "next_cover_description": {"type": "string"},
+            "next_image_prompt": {"type": "string"},
+        },
+        "required": ["title", "quote", "song_names", "next_description", "next_cover_description",
+                     "next_image_prompt"],
+        "additionalProperties": False,
+    },
+}
+
+def parse_album_metadata(content, num_songs):
+    """Check a combined metadata reply against the schema and the number of songs. Raises ValueError."""
+    data = json.loads(content)
+    if not isinstance(data, dict):
+        raise ValueError("metadata reply is not a JSON object")
+    for field in ALBUM_METADATA_SCHEMA["schema"]["required"]:
+        expected = list if field == "song_names" else str
+        if not isinstance(data.get(field), expected) or not data[field]:
+            raise ValueError(f"metadata field '{field}' is missing or empty")
+    song_names = [name.strip() if isinstance(name, str) else "" for name in data["song_names"]]
+    if len(song_names) != num_songs:
+        raise ValueError(f"metadata has {len(song_names)} song names for {num_songs} songs")
+    if not all(song_names) or len(set(song_names)) != len(song_names):
+        raise ValueError("metadata song names must be non-empty and unique")
+    return {**{field: data[field].strip() for field in data if field != "song_names"}, "song_names": song_names}
+
+def generate_album_metadata(description, cover_description, timestamps_in_minutes, model=METADATA_MODEL):
+    """
+    Title, YouTube description and the next album's prompts from one structured request.
+
+    The description is put together here from the quote, timestamps and song names, in
+    the same layout generate_video_description asks for. Raises ValueError (or the API's
+    error) if the reply can't be used.
+    """
+    request = {
+        "description": description,
+        "cover_description": cover_description,
+        "timestamps": timestamps_in_minutes,
+    }
+    data = chat_completion(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You write the metadata for a music album that a larger program generates on repeat, from the user's JSON. Reply with JSON only.\n"
+                                          "title: an album title of 1 word relating to the descriptions. Experimental, very specific and unique, not generic (examples, don't use these: Sip, Bungeoppang, Trick, Coffee and Milk, Dice, Sofa). Never include 'bop' and no quotation marks.\n"
+                                          "quote: a quote/saying about life or philosophy from a long time ago from someone mostly unknown, with its author.\n"
+                                          "song_names: exactly one unique 1 word name per timestamp, in order, all related to the title and description (if the title is Whiskey, different alcoholic drinks; if it is Busan, famous streets or places in Busan).\n"
+                                          "next_description: the music description slightly edited so the next album is a little different, keeping the same theme and style (change a country to another country, jazz to Bossa Nova, and so on).\n"
+                                          "next_cover_description: the cover description changed so the next cover is very different: keep the general theme and style but change the specific objects, scenery and background, every word at least to a synonym.\n"
+                                          "next_image_prompt: next_cover_description refined into a short, descriptive, visually vivid image generation prompt (color, setting, mood, style). It must ask for no text in the image and avoid sensitive, inappropriate or copyrighted material."},
+            {"role": "user", "content": json.dumps(request)}
+        ],
+        parse=lambda content: parse_album_metadata(content, len(timestamps_in_minutes)),
+        response_format={"type": "json_schema", "json_schema": ALBUM_METADATA_SCHEMA}
+    )
+    songs = "\n".join(f"{timestamp} {name}" for timestamp, name in zip(timestamps_in_minutes, data["song_names"]))
+    return {
+        "title": data["title"],
+        "description": f"{data['quote']}\n\n{songs}",
+        "next_description": data["next_description"],
+        "next_cover_description": data["next_cover_description"],
+        "next_image_prompt": data["next_image_prompt"],
+    }
+
+def album_metadata(description, cover_description, timestamps_in_minutes, combined=True):
+    """
+    Title, description and (when combined) the next album's prompts. If the combined
+    request fails or its reply doesn't validate, the separate title and description
+    requests are made instead and the next prompts are left as None.
+    """
+    if combined:
+        try:
+            return generate_album_metadata(description, cover_description, timestamps_in_minutes)
+        except Exception as e:
+            print(f"Combined metadata request failed ({e}); falling back to separate requests.")
+    title = generate_video_title(description, cover_description)
+    return {
+        "title": title,
+        "description": generate_video_description(description, title, timestamps_in_minutes),
+        "next_description": None,
+        "next_cover_description": None,
+        "next_image_prompt": None,
+    }
+
+def outpaint(image, prompt, name):
+    """Send an RGBA image (transparent where it should be filled) to the edit endpoint and return the result."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    png_bytes = buffer.getvalue()
+
+    key = cache.key(kind="images.edit", image=hashlib.sha256(png_bytes).hexdigest(), prompt=prompt,
+                    n=1, size="1024x1024")
+    image_bytes = cache.get_bytes(key)
+    if image_bytes is None:
+        # The transparent area of the same image doubles as the mask
+        openai_limits.before_request()
+        count('openai_calls')
+        raw_response = get_client().images.with_raw_response.edit(
+            image=(f"{name}.png", png_bytes, "image/png"),
+            mask=(f"{name}_mask.png", png_bytes, "image/png"),
+            prompt=prompt,
+            n=1,
+            size="1024x1024"
+        )
+        openai_limits.update(raw_response.headers)
+        response = raw_response.parse()
+        image_bytes = download_bytes(response.model_dump()["data"][0]["url"])
+        cache.put_bytes(key, image_bytes)
+    from PIL import Image
+    return Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+
 def extend_cover_image(cover_path):
+    from PIL import Image
     try:
         # Load the original cover image
         cover_image = Image.open(cover_path).convert("RGBA")  # Convert to RGBA
@@ -162,48 +354,20 @@ def extend_cover_image(cover_path):
         landscape_image = Image.new("RGBA", (new_width, new_height), (255, 255, 255, 0))
         landscape_image.paste(cover_image, ((new_width - original_width) // 2, 0), cover_image)
 
-        # Save this blank-extended image temporarily
-        temp_landscape_path = "covers/temp_landscape_cover.png"
-        landscape_image.save(temp_landscape_path)
-
         # Define prompts for left and right outpainting
         left_outpainting_prompt = "A visually cohesive extension of the left side of the cover art, matching style and atmosphere"
         right_outpainting_prompt = "A visually cohesive extension of the right side of the cover art, matching style and atmosphere"
 
-        # Load the temp landscape image
-        temp_image = Image.open(temp_landscape_path)
-
-        # Separate the left and right halves, convert to RGBA, and save as temporary files
-        left_image = temp_image.crop((0, 0, original_width, new_height)).convert("RGBA")
-        right_image = temp_image.crop((original_width, 0, new_width, new_height)).convert("RGBA")
-        left_image_path = "covers/temp_left_image.png"
-        right_image_path = "covers/temp_right_image.png"
-        left_image.save(left_image_path)
-        right_image.save(right_image_path)
-
-        # Use the OpenAI API to outpaint the left side
-        with open(left_image_path, "rb") as left_file:
-            left_response = client.images.edit(
-                image=left_file,
-                mask=left_file,
-                prompt=left_outpainting_prompt,
-                n=1,
-                size="1024x1024"
-            )
-        left_url = left_response.model_dump()["data"][0]["url"]
-        left_extended = Image.open(requests.get(left_url, stream=True).raw).convert("RGBA")
-
-        # Use the OpenAI API to outpaint the right side
-        with open(right_image_path, "rb") as right_file:
-            right_response = client.images.edit(
-                image=right_file,
-                mask=right_file,
-                prompt=right_outpainting_prompt,
-                n=1,
-                size="1024x1024"
-            )
-        right_url = right_response.model_dump()["data"][0]["url"]
-        right_extended = Image.open(requests.get(right_url, stream=True).raw).convert("RGBA")
+        # Separate the left and right halves; they are sent as in-memory PNGs
+        left_image = landscape_image.crop((0, 0, original_width, new_height))
+        right_image = landscape_image.crop((original_width, 0, new_width, new_height))
+
+        # Outpaint both sides at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            left_future = executor.submit(propagate(outpaint), left_image, left_outpainting_prompt, "left")
+            right_future = executor.submit(propagate(outpaint), right_image, right_outpainting_prompt, "right")
+            left_extended = left_future.result()
+            right_extended = right_future.result()
 
         # Create the final landscape image and paste all three parts
         final_landscape = Image.new("RGBA", (new_width, new_height), (255, 255, 255, 0))
@@ -211,10 +375,6 @@ def extend_cover_image(cover_path):
         final_landscape.paste(cover_image, ((new_width - original_width) // 2, 0), cover_image)
         final_landscape.paste(right_extended, (original_width, 0), right_extended)
 
-        # Define the final save path for the extended landscape cover
-        final_cover_path = "covers/landscape_cover.png"
-        final_landscape.convert("RGB").save(final_cover_path)  # Convert to RGB for saving without transparency
-
         # Crop to a 16:9 aspect ratio to fit YouTube's format
         target_ratio = 16 / 9
         final_width, final_height = final_landscape.size
@@ -233,13 +393,10 @@ def extend_cover_image(cover_path):
             bottom = top + new_height
             left, right = 0, final_width
 
+        # Define the final save path for the extended landscape cover and save it once
+        final_cover_path = os.path.join(os.path.dirname(cover_path), "landscape_cover.png")
         cropped_final = final_landscape.crop((left, top, right, bottom))
-        cropped_final.save(final_cover_path)
-
-        # Clean up temporary files
-        os.remove(temp_landscape_path)
-        os.remove(left_image_path)
-        os.remove(right_image_path)
+        cropped_final.convert("RGB").save(final_cover_path)  # Convert to RGB for saving without transparency
 
         return final_cover_path
 
@@ -0,0 +1,52 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from atomicfile import replacing
+
+
+class PcmStore:
+    """
+    Scratch directory of decoded clips, kept as raw 16-bit PCM files and opened as numpy.memmap.
+
+    ffmpeg decodes each clip straight into its file exactly once; every later pass (analysis,
+    trimming, fades, mixing) works on views of the mapped file, so only the pages being read
+    are in memory and they are clean pages the kernel can drop at any time, instead of
+    anonymous memory that has to be swapped out. A resumed album reuses clips already decoded.
+    """
+
+    def __init__(self, directory=None, frame_rate=44100, channels=2):
+        self.directory = directory or tempfile.mkdtemp(prefix="pcm_")
+        self.frame_rate = frame_rate
+        self.channels = channels
+
+    def path(self, audio_file):
+        return os.path.join(self.directory, f"{os.path.basename(audio_file)}.s16")
+
+    def decode(self, audio_file):
+        """Decode audio_file into the store (unless it already is) and return it mapped."""
+        path = self.path(audio_file)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            with replacing(path) as temp_path:
+                subprocess.run(
+                    ['ffmpeg', '-loglevel', 'error', '-y', '-i', audio_file, '-f', 's16le', '-ac', str(self.channels),
+                     '-ar', str(self.frame_rate), temp_path],
+                    check=True
+                )
+        return self.open(path)
+
+    def open(self, path):
+        """Map a stored PCM file read-only as an int16 array of shape (frames, channels)."""
+        # NumPy is only loaded once there is audio to map, so importing this module stays cheap
+        import numpy as np
+
+        frames = os.path.getsize(path) // (2 * self.channels)
+        if frames == 0:
+            # numpy can't map an empty file
+            return np.zeros((0, self.channels), dtype=np.int16)
+        return np.memmap(path, dtype=np.int16, mode='r', shape=(frames, self.channels))
+
+    def clear(self):
+        """Delete the store and everything in it. Arrays still mapped stay readable until dropped."""
+        shutil.rmtree(self.directory, ignore_errors=True)
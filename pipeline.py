@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from audiotools import AlbumEncoder, probe_duration
+from pcmstore import PcmStore
+from tracing import count
+
+# Generator stages for the streaming album pipeline. Each stage pulls from the previous
+# one, so a song is filtered, decoded and faded as soon as it has been downloaded
+# instead of waiting for every other song of the album.
+
+
+def decoded_samples(audio_files, min_duration=30, frame_rate=44100, channels=2, store=None):
+    """
+    Yield (path, memory-mapped int16 sample array) for songs of at least min_duration
+    seconds, decoding each once into a PcmStore. The next song is decoded by ffmpeg while
+    the caller is still mixing the current one. Without a store, a temporary one is used
+    and deleted once the songs have been consumed.
+    """
+    temporary = store is None
+    if temporary:
+        store = PcmStore(frame_rate=frame_rate, channels=channels)
+
+    pending = None
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for audio_file in audio_files:
+                if probe_duration(audio_file) < min_duration:
+                    print(f"Skipping {audio_file}: shorter than {min_duration}s.")
+                    continue
+                future = executor.submit(store.decode, audio_file)
+                if pending is not None:
+                    yield pending[0], pending[1].result()
+                pending = (audio_file, future)
+            if pending is not None:
+                yield pending[0], pending[1].result()
+    finally:
+        if temporary:
+            store.clear()
+
+
+def checked_samples(songs, checker=None, min_duration=30, frame_rate=44100):
+    """
+    Yield (path, int16 sample array) for decoded songs that pass the ClipChecker: mostly
+    silent, broken up, clipped and duplicate clips are dropped and silent ends trimmed.
+    """
+    from clipcheck import ClipChecker
+
+    checker = checker or ClipChecker(min_duration=min_duration, frame_rate=frame_rate)
+    for audio_file, samples in songs:
+        samples, report = checker.check(audio_file, samples)
+        if samples is None:
+            print(f"Dropping {audio_file}: {report['rejected']}.")
+            count('clips_dropped')
+            continue
+        if report["trimmed"]:
+            print(f"Trimmed {report['trimmed']}s of silence from {audio_file}.")
+            count('clips_trimmed')
+        yield audio_file, samples
+
+
+def mix_stream(songs, combined_audio_path="audio/combined_audio_with_fade_out.m4a", fade_duration=1000,
+               crossfade_duration=0, **mixer_options):
+    """
+    Loudness-normalize, fade (or crossfade) each decoded song with NumPy and stream it into
+    the album encoder as it arrives. mixer_options (target_loudness, chunk_seconds, ...) go
+    to AlbumMixer. Returns (path, timestamps in seconds).
+    """
+    from audioengine import AlbumMixer
+
+    with AlbumEncoder(combined_audio_path) as encoder:
+        mixer = AlbumMixer(encoder, fade_out=fade_duration, crossfade=crossfade_duration, **mixer_options)
+        for audio_file, samples in songs:
+            mixer.add(samples)
+            print(f"Added {audio_file} to the album ({len(mixer.timestamps)} songs so far).")
+        return mixer.finish()
+
+
+def combine_files(audio_files, combined_audio_path="audio/combined_audio_with_fade_out.m4a", min_duration=30,
+                  fade_duration=1000, crossfade_duration=0, scratch_dir=None):
+    """
+    Filter, decode, check and combine a finished list of songs, decoding into a PcmStore in
+    scratch_dir (a temporary directory if None). Picklable, so it can run in a process pool.
+    """
+    store = PcmStore(scratch_dir) if scratch_dir else None
+    songs = checked_samples(decoded_samples(audio_files, min_duration, store=store), min_duration=min_duration)
+    return mix_stream(songs, combined_audio_path, fade_duration, crossfade_duration)
+
+
+def format_timestamps(timestamps_in_seconds):
+    """Convert second offsets to MM:SS strings for the video description."""
+    timestamps_in_minutes = []
+    for timestamp in timestamps_in_seconds:
+        minutes = int(timestamp // 60)
+        seconds = int(timestamp % 60)
+        timestamps_in_minutes.append(f"{minutes:02}:{seconds:02}")
+    return timestamps_in_minutes
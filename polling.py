@@ -0,0 +1,153 @@
+import json
+import math
+import os
+import random
+import time
+from atomicfile import write_json
+
+
+class FixedInterval:
+    """Poll at a constant rate (the original behaviour)."""
+
+    def __init__(self, interval=5):
+        self.interval = interval
+
+    def next_delay(self, elapsed, polls):
+        return self.interval
+
+    def polls_at(self, elapsed):
+        """Polls this schedule has made after elapsed seconds."""
+        return int(elapsed // self.interval)
+
+    def record(self, duration):
+        pass
+
+
+class ExponentialBackoff:
+    """Start polling quickly and back off geometrically, with random jitter to spread requests."""
+
+    def __init__(self, initial=2, factor=1.5, max_interval=30, jitter=0.2):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.jitter = jitter
+
+    def next_delay(self, elapsed, polls):
+        delay = min(self.initial * (self.factor ** polls), self.max_interval)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def polls_at(self, elapsed):
+        """Polls this schedule has made (ignoring jitter) after elapsed seconds."""
+        if self.factor <= 1:
+            return int(elapsed // self.initial)
+        # The geometric part takes initial * (factor**n - 1) / (factor - 1) seconds for n polls
+        capped_at = math.ceil(math.log(self.max_interval / self.initial, self.factor))
+        geometric_seconds = self.initial * (self.factor ** capped_at - 1) / (self.factor - 1)
+        if elapsed >= geometric_seconds:
+            return capped_at + int((elapsed - geometric_seconds) // self.max_interval)
+        return int(math.log(1 + elapsed * (self.factor - 1) / self.initial, self.factor))
+
+    def record(self, duration):
+        pass
+
+
+class EtaAwarePolling:
+    """
+    Learn how long clips usually take to go from submitted to streaming and barely poll
+    before that point. Once a clip is close to (or past) its expected finish time, polling
+    switches to a short backoff so early finishers are still picked up quickly.
+
+    Observed durations are kept in a small JSON history file between runs.
+    """
+
+    def __init__(self, history_path="poll_history.json", history_size=50, lead_time=10,
+                 fallback=None):
+        self.history_path = history_path
+        self.history_size = history_size
+        self.lead_time = lead_time
+        self.fallback = fallback or ExponentialBackoff(initial=2, max_interval=15)
+        self.durations = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.history_path):
+            return []
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as file:
+                return json.load(file)[-self.history_size:]
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable poll history {self.history_path}. Reason: {e}")
+            return []
+
+    def eta(self):
+        """Return a conservative estimate (lower quartile) of submitted->streaming time, or None."""
+        if len(self.durations) < 3:
+            return None
+        ordered = sorted(self.durations)
+        return ordered[len(ordered) // 4]
+
+    def next_delay(self, elapsed, polls):
+        eta = self.eta()
+        if eta is None:
+            return self.fallback.next_delay(elapsed, polls)
+
+        wake_at = eta - self.lead_time
+        if elapsed < wake_at:
+            # Sleep until shortly before the clip is expected, but re-check occasionally
+            return min(wake_at - elapsed, max(eta / 4, 5))
+        # Close to or past the expected time: poll tightly, backing off slowly from there. The
+        # backoff continues from wake_at, as if the fallback had been polling since then.
+        return self.fallback.next_delay(elapsed - wake_at, self.fallback.polls_at(elapsed - wake_at))
+
+    def record(self, duration):
+        self.durations = (self.durations + [round(duration, 2)])[-self.history_size:]
+        try:
+            # Several albums may share the history file, so replace it atomically
+            write_json(self.history_path, self.durations)
+        except OSError as e:
+            print(f"Failed to save poll history {self.history_path}. Reason: {e}")
+
+
+class Deadline:
+    """Overall time budget shared by every batch of an album."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = time.monotonic()
+
+    def remaining(self):
+        return self.seconds - (time.monotonic() - self.started)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class PollMetrics:
+    """Count polls per clip and how long each clip took to be detected as finished."""
+
+    def __init__(self):
+        self.polls = {}
+        self.durations = {}
+
+    def record_poll(self, clip_ids):
+        for clip_id in clip_ids:
+            self.polls[clip_id] = self.polls.get(clip_id, 0) + 1
+
+    def record_done(self, clip_id, duration):
+        self.durations[clip_id] = duration
+
+    def summary(self):
+        clips = len(self.polls)
+        total = sum(self.polls.values())
+        return {
+            "clips": clips,
+            "total_polls": total,
+            "polls_per_clip": round(total / clips, 2) if clips else 0,
+            "max_polls": max(self.polls.values(), default=0),
+            "mean_seconds_to_streaming": round(sum(self.durations.values()) / len(self.durations), 2)
+            if self.durations else None,
+        }
+
+
+def default_strategy():
+    """Polling strategy used when the caller does not pick one."""
+    return EtaAwarePolling()
@@ -0,0 +1,211 @@
+import re
+import threading
+import time
+from callapi import get_quota_information
+
+# Suno charges this many credits for one generate call (two clips)
+SUNO_CREDITS_PER_BATCH = 10
+
+
+class QuotaExhausted(Exception):
+    """Raised when a request cannot fit in the remaining quota before its timeout."""
+
+
+class TokenBucket:
+    """Classic token bucket: rate tokens per second, bursts of up to capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available, then take them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SunoQuota:
+    """
+    Tracks the Suno server's remaining credits and schedules generation submissions to fit.
+
+    Credits come from /api/get_limit and are refreshed every refresh_interval seconds. Each
+    submission reserves its cost first, so concurrent albums never spend past the remaining
+    budget; callers wait (and re-check the server) instead of failing after the fact. An
+    optional token bucket also paces submissions to submissions_per_minute, letting up to
+    submission_burst of them through back to back.
+    """
+
+    def __init__(self, fetch=get_quota_information, credits_per_batch=SUNO_CREDITS_PER_BATCH,
+                 refresh_interval=60, reserve_floor=0, submissions_per_minute=None, submission_burst=1):
+        self.fetch = fetch
+        self.credits_per_batch = credits_per_batch
+        self.refresh_interval = refresh_interval
+        self.reserve_floor = reserve_floor
+        self.credits_left = None
+        self.reserved = 0
+        self.waiting = 0
+        self.last_refresh = None
+        self._refreshing = False
+        self.pace(submissions_per_minute, submission_burst)
+        self._condition = threading.Condition()
+
+    def pace(self, submissions_per_minute, burst=1):
+        """Pace submissions to submissions_per_minute in bursts of up to burst; None turns pacing off."""
+        self.bucket = TokenBucket(submissions_per_minute / 60, burst) if submissions_per_minute else None
+
+    def refresh(self):
+        """Read the remaining credits from the server. Leaves the budget unchanged if that fails."""
+        # The HTTP call (with its retries) runs without the lock, so commits and releases go on
+        try:
+            credits_left = self.fetch().get("credits_left")
+            fetched = True
+        except Exception as e:
+            print(f"Failed to read Suno quota. Reason: {e}")
+            fetched = False
+        with self._condition:
+            if fetched:
+                self.credits_left = credits_left
+            self.last_refresh = time.monotonic()
+            self._condition.notify_all()
+
+    def _refresh_if_stale(self):
+        # Only one caller fetches; the others wait for its result without holding the lock
+        with self._condition:
+            while self._refreshing:
+                self._condition.wait()
+            if self.last_refresh is not None and time.monotonic() - self.last_refresh < self.refresh_interval:
+                return
+            self._refreshing = True
+        try:
+            self.refresh()
+        finally:
+            with self._condition:
+                self._refreshing = False
+                self._condition.notify_all()
+
+    def available(self):
+        """Credits not yet spent or reserved, or None if the server's budget is unknown."""
+        if self.credits_left is None:
+            return None
+        return self.credits_left - self.reserved - self.reserve_floor
+
+    def wait_for(self, credits, timeout=None, reserve=False):
+        """Block until at least credits are available, reserving them if reserve is set."""
+        started = time.monotonic()
+        with self._condition:
+            self.waiting += 1
+        try:
+            while True:
+                self._refresh_if_stale()
+                with self._condition:
+                    available = self.available()
+                    if available is None or available >= credits:
+                        if reserve:
+                            self.reserved += credits
+                        return
+                    if timeout is not None and time.monotonic() - started >= timeout:
+                        raise QuotaExhausted(f"Needed {credits} Suno credits, only {available} available.")
+                    print(f"Waiting for Suno credits ({available} available, {credits} needed)...")
+                    self._condition.wait(self.refresh_interval)
+        finally:
+            with self._condition:
+                self.waiting -= 1
+
+    def acquire(self, timeout=None):
+        """Reserve the credits for one generation call, waiting for budget if needed."""
+        self.wait_for(self.credits_per_batch, timeout, reserve=True)
+        if self.bucket:
+            self.bucket.acquire()
+
+    def commit(self):
+        """The reserved call went through: count its credits as spent until the next refresh."""
+        with self._condition:
+            self.reserved -= self.credits_per_batch
+            if self.credits_left is not None:
+                self.credits_left -= self.credits_per_batch
+
+    def release(self):
+        """The reserved call failed: return its credits to the budget."""
+        with self._condition:
+            self.reserved -= self.credits_per_batch
+            self._condition.notify_all()
+
+    def status(self):
+        return {"credits_left": self.credits_left, "reserved": self.reserved, "queue_depth": self.waiting}
+
+
+def _parse_reset(value):
+    """Convert OpenAI reset durations such as '1s', '250ms' or '6m0s' to seconds."""
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value or ""):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+class OpenAIRateLimits:
+    """
+    Follows the x-ratelimit-* headers OpenAI returns and pauses new requests once the
+    remaining request or token budget reaches min_remaining, until the window resets.
+    """
+
+    def __init__(self, min_remaining=1):
+        self.min_remaining = min_remaining
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.resume_at = 0
+        self.waiting = 0
+        self._lock = threading.Lock()
+
+    def update(self, headers):
+        with self._lock:
+            requests_left = headers.get("x-ratelimit-remaining-requests")
+            tokens_left = headers.get("x-ratelimit-remaining-tokens")
+            if requests_left is not None:
+                self.remaining_requests = int(requests_left)
+            if tokens_left is not None:
+                self.remaining_tokens = int(tokens_left)
+
+            # Once a budget runs low, hold new requests until its window resets
+            reset = 0
+            if self.remaining_requests is not None and self.remaining_requests <= self.min_remaining:
+                reset = max(reset, _parse_reset(headers.get("x-ratelimit-reset-requests")))
+            if self.remaining_tokens is not None and self.remaining_tokens <= self.min_remaining:
+                reset = max(reset, _parse_reset(headers.get("x-ratelimit-reset-tokens")))
+            if reset:
+                self.resume_at = max(self.resume_at, time.monotonic() + reset)
+
+    def before_request(self):
+        """Sleep until the rate-limit window has room for another request."""
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            with self._lock:
+                self.waiting += 1
+            print(f"OpenAI rate limit nearly reached, waiting {delay:.1f}s...")
+            time.sleep(delay)
+            with self._lock:
+                self.waiting -= 1
+
+    def status(self):
+        return {"remaining_requests": self.remaining_requests, "remaining_tokens": self.remaining_tokens,
+                "queue_depth": self.waiting}
+
+
+# Shared by every album in this process
+suno_quota = SunoQuota()
+openai_limits = OpenAIRateLimits()
+
+
+def quota_status():
+    """Current budget and queue depth for both services."""
+    return {"suno": suno_quota.status(), "openai": openai_limits.status()}
@@ -0,0 +1,189 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from callapi import generate_audio_by_prompt, get_audio_information
+from downloadsong import DownloadError, download_mp3
+from polling import PollMetrics, default_strategy
+from ratelimit import suno_quota
+from tracing import count, propagate
+
+
+def submit_batch(description):
+    """Submit one generation request and return the IDs of the clips it produced."""
+    # Reserve the credits first so concurrent albums never overrun the server's quota
+    suno_quota.acquire()
+    try:
+        data = generate_audio_by_prompt({
+            "prompt": description,
+            "make_instrumental": True,
+            "wait_audio": False
+        })
+    except Exception:
+        suno_quota.release()
+        raise
+    suno_quota.commit()
+
+    # Check if the API returned the expected structure
+    if not data or len(data) < 2:
+        raise ValueError("The API did not return two songs as expected.")
+
+    return [song['id'] for song in data[:2]]
+
+
+def clip_ready(song):
+    """
+    True once a clip can be downloaded: it is streaming or already complete. A clip may skip
+    'streaming' entirely or report a newer status, so any clip with an audio URL that hasn't
+    failed counts as ready too.
+    """
+    status = song.get("status")
+    return status in ('streaming', 'complete') or (status != 'error' and bool(song.get("audio_url")))
+
+
+def _finish_download(future, download, on_download):
+    """Report a finished download to the caller's callback and return its path, or None if it failed."""
+    clip_id, output_path = download
+    try:
+        future.result()
+    except DownloadError as e:
+        # The clip stays pending in the caller's records, so a resumed job can fetch it again
+        print(f"Skipping clip {clip_id}: {e}")
+        return None
+    if on_download:
+        on_download(clip_id, output_path)
+    return output_path
+
+
+def iter_songs(description, num_batches, max_concurrent=4, strategy=None, deadline=None,
+               metrics=None, download_workers=4, songs_dir="songs", resume_clips=(), first_batch=0,
+               on_submit=None, on_download=None, on_generated=None):
+    """
+    Generate num_batches batches at once and yield each song path as soon as it is downloaded.
+
+    Up to max_concurrent batches are in flight on the Suno server at any time. All pending
+    clips are polled together with one /api/get call per tick, and each clip starts
+    downloading as soon as it is ready (see clip_ready). Paths are yielded in completion order.
+
+    strategy decides how long to wait between ticks (see polling.py), deadline is an
+    optional polling.Deadline shared by the whole album and metrics an optional
+    polling.PollMetrics that collects poll counts per clip.
+
+    resume_clips maps IDs that were submitted earlier (for example before a crash) to the
+    time.time() they were submitted at, or None if unknown; they are polled again rather
+    than regenerated, and first_batch numbers the new batches after them.
+    on_submit(clip_ids, batch_index) and on_download(clip_id, path) are called as clips
+    are submitted and downloaded, so the caller can checkpoint progress. on_generated() is
+    called once every clip is ready or failed, while the last downloads may still be running.
+    """
+    strategy = strategy or default_strategy()
+    metrics = metrics if metrics is not None else PollMetrics()
+    remaining = num_batches
+    in_flight = {}        # clip ID -> batch index, for clips not yet ready
+    submitted_at = {}     # clip ID -> time the clip was submitted
+    untimed = set()       # resumed clips whose submit time is unknown
+    batches_open = {}     # batch index -> number of clips still pending
+    downloads = {}        # download future -> (clip ID, output path)
+    next_poll = 0
+    downloaded = 0
+
+    # Clips from an interrupted run are polled again, each counted as its own batch
+    for clip_id, submitted in dict(resume_clips).items():
+        batch_index = ('resumed', clip_id)
+        in_flight[clip_id] = batch_index
+        batches_open[batch_index] = 1
+        if submitted is None:
+            # Timing it from now would teach the strategy a far too short generation time
+            submitted_at[clip_id] = time.monotonic()
+            untimed.add(clip_id)
+        else:
+            # The server kept generating while we were down, so its age counts from the submit
+            submitted_at[clip_id] = time.monotonic() - max(time.time() - submitted, 0)
+
+    # Downloads count their bytes towards the caller's open stages
+    download = propagate(download_mp3)
+    with ThreadPoolExecutor(max_workers=download_workers) as executor:
+        while True:
+            if deadline is not None and deadline.expired():
+                raise Exception("Audio generation timed out.")
+
+            # Keep the server busy up to the concurrency limit
+            while remaining > 0 and len(batches_open) < max_concurrent:
+                batch_index = first_batch + num_batches - remaining
+                clip_ids = submit_batch(description)
+                print(f"Submitted batch {batch_index + 1}/{first_batch + num_batches}: {','.join(clip_ids)}")
+                if on_submit:
+                    on_submit(clip_ids, batch_index)
+                for clip_id in clip_ids:
+                    in_flight[clip_id] = batch_index
+                    submitted_at[clip_id] = time.monotonic()
+                batches_open[batch_index] = len(clip_ids)
+                remaining -= 1
+
+            if in_flight and time.monotonic() >= next_poll:
+                # One batched status request for every pending clip
+                data = get_audio_information(",".join(in_flight))
+                metrics.record_poll(in_flight)
+                count('polls')
+                for song in data:
+                    clip_id = song.get("id")
+                    if clip_id not in in_flight:
+                        continue
+
+                    if clip_ready(song):
+                        if clip_id not in untimed:
+                            duration = time.monotonic() - submitted_at[clip_id]
+                            strategy.record(duration)
+                            metrics.record_done(clip_id, duration)
+                        output_path = os.path.join(songs_dir, f"{clip_id}_song.mp3")
+                        future = executor.submit(download, song['audio_url'], output_path)
+                        downloads[future] = (clip_id, output_path)
+                    elif song.get("status") == 'error':
+                        print(f"Clip {clip_id} failed on the server, skipping it.")
+                    else:
+                        continue
+
+                    batch_index = in_flight.pop(clip_id)
+                    batches_open[batch_index] -= 1
+                    if batches_open[batch_index] == 0:
+                        del batches_open[batch_index]
+
+                if in_flight:
+                    # Poll again when the soonest clip is worth checking
+                    now = time.monotonic()
+                    delay = min(
+                        strategy.next_delay(now - submitted_at[clip_id], metrics.polls.get(clip_id, 0))
+                        for clip_id in in_flight
+                    )
+                    if deadline is not None:
+                        delay = min(delay, max(deadline.remaining(), 0))
+                    next_poll = now + delay
+
+            # Hand finished downloads to the caller straight away
+            for future in [future for future in downloads if future.done()]:
+                output_path = _finish_download(future, downloads.pop(future), on_download)
+                if output_path:
+                    downloaded += 1
+                    yield output_path
+
+            if not in_flight:
+                if remaining == 0:
+                    if on_generated:
+                        on_generated()
+                    break
+                continue
+
+            # Sleep until the next poll, waking early if a download finishes
+            timeout = max(next_poll - time.monotonic(), 0)
+            if downloads:
+                wait(downloads, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout)
+
+        for future in as_completed(list(downloads)):
+            output_path = _finish_download(future, downloads.pop(future), on_download)
+            if output_path:
+                downloaded += 1
+                yield output_path
+
+    print(f"{downloaded} songs downloaded. Polling: {metrics.summary()}")
+
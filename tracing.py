@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS and child CPU are then left out
+    resource = None
+
+RUN_LOG = os.getenv("RUN_LOG", "run_log.jsonl")
+RUN_ID = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+# Functions called with every finished stage's record, e.g. to collect one job's timings
+_listeners = []
+
+
+class Span:
+    """One timed stage. Counters added while it is open accumulate in counters."""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, counter, amount):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+
+def _stack():
+    if not hasattr(_local, "spans"):
+        _local.spans = []
+    return _local.spans
+
+
+def count(counter, amount=1):
+    """Add to a counter (API calls, polls, bytes) on every stage open in this thread."""
+    for span in _stack():
+        span.add(counter, amount)
+
+
+def propagate(func):
+    """
+    Wrap func so that, when run on a worker thread, its counters still go to the stages
+    that were open in the thread that created the wrapper.
+    """
+    spans = list(_stack())
+
+    def run(*args, **kwargs):
+        previous = _stack()[:]
+        _local.spans = list(spans)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.spans = previous
+    return run
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(children, 1)
+
+
+def _child_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def add_listener(func):
+    """Call func(record) for every stage that finishes from now on, in the thread it ran in."""
+    _listeners.append(func)
+
+
+def remove_listener(func):
+    _listeners.remove(func)
+
+
+def write_record(record, path=None):
+    """Append one JSON line to the run log."""
+    with _write_lock:
+        with open(path or RUN_LOG, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a pipeline stage and append its metrics to the run log.
+
+    Records wall time, this thread's CPU time and every counter added while the stage was
+    open. Fields (for example the album's job id) are inherited by nested stages. Works as a
+    decorator too.
+
+    getrusage can't attribute memory or child processes to a stage, so two kinds of values
+    are process-wide and named that way: process_peak_rss_mb and children_peak_rss_mb are
+    the peaks of the whole process (and of its largest child) so far, not of this stage,
+    and process_child_cpu_seconds is the CPU of every child process (ffmpeg) that finished
+    while the stage was open, including children of stages running alongside it.
+    """
+    parent = _stack()[-1] if _stack() else None
+    span = Span(name, {**(parent.fields if parent else {}), **fields})
+    started = time.time()
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    process_child_cpu = _child_cpu()
+    error = None
+    _stack().append(span)
+    try:
+        yield span
+    except BaseException as e:
+        error = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        _stack().remove(span)
+        process_peak_rss, children_peak_rss = _peak_rss_mb()
+        record = {
+            "run": RUN_ID,
+            "stage": name,
+            **span.fields,
+            "started": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - wall, 3),
+            "cpu_seconds": round(time.thread_time() - cpu, 3),
+            "process_child_cpu_seconds": round(_child_cpu() - process_child_cpu, 3),
+            "process_peak_rss_mb": process_peak_rss,
+            "children_peak_rss_mb": children_peak_rss,
+            "counters": span.counters,
+            "error": error,
+        }
+        write_record(record)
+        for listener in list(_listeners):
+            listener(record)
+
+
+def read_records(path=RUN_LOG, run=None):
+    records = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                if run is None or record.get("run") == run:
+                    records.append(record)
+    return records
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(records):
+    """
+    Per-stage count, wall-time percentiles, mean thread CPU, mean process-wide child CPU,
+    the highest process peak RSS seen when the stage ended, and summed counters.
+    """
+    by_stage = {}
+    for record in records:
+        by_stage.setdefault(record["stage"], []).append(record)
+
+    summary = {}
+    for name, stage_records in by_stage.items():
+        walls = [record["wall_seconds"] for record in stage_records]
+        counters = {}
+        for record in stage_records:
+            for counter, amount in record["counters"].items():
+                counters[counter] = counters.get(counter, 0) + amount
+        # Run logs written before the process-wide fields were renamed use the old names
+        rss = [record.get("process_peak_rss_mb", record.get("peak_rss_mb")) for record in stage_records]
+        rss = [value for value in rss if value is not None]
+        child_cpu = [record.get("process_child_cpu_seconds", record.get("child_cpu_seconds", 0))
+                     for record in stage_records]
+        summary[name] = {
+            "count": len(stage_records),
+            "errors": sum(1 for record in stage_records if record.get("error")),
+            "p50": percentile(walls, 50),
+            "p90": percentile(walls, 90),
+            "p99": percentile(walls, 99),
+            "max": max(walls),
+            "mean_cpu": round(sum(record["cpu_seconds"] for record in stage_records) / len(stage_records), 3),
+            "mean_process_child_cpu": round(sum(child_cpu) / len(stage_records), 3),
+            "process_peak_rss_mb": max(rss) if rss else None,
+            "counters": counters,
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'stage':<20}{'n':>5}{'err':>5}{'p50 s':>10}{'p90 s':>10}{'p99 s':>10}{'max s':>10}"
+          f"{'cpu s':>9}{'child s*':>10}{'rss MB*':>9}  counters")
+    for name, row in sorted(summary.items(), key=lambda item: -item[1]["p50"]):
+        counters = ", ".join(f"{counter}={amount}" for counter, amount in sorted(row["counters"].items()))
+        rss = "-" if row["process_peak_rss_mb"] is None else f"{row['process_peak_rss_mb']:.0f}"
+        print(f"{name:<20}{row['count']:>5}{row['errors']:>5}{row['p50']:>10.2f}{row['p90']:>10.2f}"
+              f"{row['p99']:>10.2f}{row['max']:>10.2f}{row['mean_cpu']:>9.2f}{row['mean_process_child_cpu']:>10.2f}"
+              f"{rss:>9}  {counters}")
+    print("* process-wide: child CPU includes stages running alongside, RSS is the process peak so far")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize per-stage timings from a run log.")
+    parser.add_argument("log", nargs="?", default=RUN_LOG, help="JSON-lines run log (default: %(default)s)")
+    parser.add_argument("--run", help="only include records from this run id")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = summarize(read_records(args.log, args.run))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
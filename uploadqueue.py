@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from jobs import AlbumJob
+from uploadtoyoutube import get_authenticated_service, upload_video
+from tracing import stage
+from atomicfile import write_json
+
+QUEUE_PATH = "upload_queue.json"
+
+
+class UploadQueue:
+    """
+    Persistent queue of finished videos waiting to be uploaded to YouTube.
+
+    A background thread uploads entries one at a time while the caller moves on to the
+    next album. Entries are kept in a JSON file, so uploads still queued (or cut off
+    mid-upload) when the process stops are picked up again on the next start; the
+    resumable upload continues from its saved session. put() blocks once max_depth
+    uploads are waiting, so encoding can't run arbitrarily far ahead of the uploads.
+    Finished uploads are dropped from the file keep_done seconds after they finished.
+    """
+
+    def __init__(self, path=QUEUE_PATH, max_depth=2, max_attempts=3, retry_delay=60, upload_func=None,
+                 keep_done=7 * 24 * 3600):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keep_done = keep_done
+        self.upload_func = upload_func or self._upload
+        self.entries = self._load()
+        self.current = None
+        self._closing = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+        # Anything that was uploading when the last run stopped goes back in line
+        for entry in self.entries:
+            if entry["status"] == "uploading":
+                entry["status"] = "queued"
+        self._prune()
+        self._save()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _save(self):
+        write_json(self.path, self.entries, indent=2)
+
+    def _prune(self):
+        # Entries from before finish times were recorded fall back to when they were queued
+        cutoff = (datetime.now() - timedelta(seconds=self.keep_done)).isoformat(timespec="seconds")
+        self.entries = [entry for entry in self.entries
+                        if entry["status"] != "done" or entry.get("finished", entry["queued"]) >= cutoff]
+
+    def _pending(self):
+        return [entry for entry in self.entries if entry["status"] in ("queued", "uploading")]
+
+    def put(self, video_path, title, description, category='10', tags=(), privacy='public', job_dir=None):
+        """Queue a video for upload, waiting while the queue is full. Returns the entry."""
+        with self._condition:
+            # A resumed album may queue the same video again; keep the existing entry
+            for entry in self._pending():
+                if entry["video_path"] == video_path:
+                    return entry
+            while len(self._pending()) >= self.max_depth:
+                print(f"Upload queue full ({self.max_depth} waiting), waiting for an upload to finish...")
+                self._condition.wait()
+
+            entry = {
+                "video_path": video_path,
+                "title": title,
+                "description": description,
+                "category": category,
+                "tags": list(tags),
+                "privacy": privacy,
+                "job_dir": job_dir,
+                "status": "queued",
+                "attempts": 0,
+                "not_before": 0,
+                "queued": datetime.now().isoformat(timespec="seconds"),
+            }
+            self.entries.append(entry)
+            self._save()
+            self._condition.notify_all()
+        print(f"Queued {video_path} for upload. Queue: {self.status()}")
+        return entry
+
+    def start(self):
+        """Start the background upload thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="upload-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, wait=True):
+        """Stop the upload thread, first letting it drain the queue if wait is set."""
+        with self._condition:
+            if wait:
+                # A worker thread that died would never notify, so keep checking it is alive
+                while self._pending() and self._thread is not None and self._thread.is_alive():
+                    self._condition.wait(5)
+            self._closing = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _next_entry(self):
+        # Called with the lock held; returns the oldest entry that is due, or None
+        now = time.time()
+        for entry in self.entries:
+            if entry["status"] == "queued" and entry["not_before"] <= now:
+                return entry
+        return None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                entry = self._next_entry()
+                while entry is None and not self._closing:
+                    # Wake up for new entries, or when a delayed retry becomes due
+                    self._condition.wait(5 if self._pending() else None)
+                    entry = self._next_entry()
+                if entry is None:
+                    return
+                entry["status"] = "uploading"
+                entry["attempts"] += 1
+                self.current = entry["video_path"]
+                self._save()
+
+            try:
+                job_id = os.path.basename(entry["job_dir"]) if entry["job_dir"] else None
+                with stage('upload', job=job_id, queued=True):
+                    response = self.upload_func(entry)
+                outcome = {"status": "done", "video_id": response.get('id'),
+                           "finished": datetime.now().isoformat(timespec="seconds")}
+            except Exception as e:
+                print(f"Upload of {entry['video_path']} failed (attempt {entry['attempts']}): {e}")
+                if entry["attempts"] < self.max_attempts:
+                    outcome = {"status": "queued", "error": str(e), "not_before": time.time() + self.retry_delay}
+                else:
+                    outcome = {"status": "failed", "error": str(e)}
+
+            with self._condition:
+                entry.update(outcome)
+                self.current = None
+                self._prune()
+                self._save()
+                self._condition.notify_all()
+            if entry["status"] == "done" and entry["job_dir"]:
+                self._finish_job(entry)
+
+    @staticmethod
+    def _upload(entry):
+        youtube = get_authenticated_service()
+        return upload_video(youtube, entry["video_path"], entry["title"], entry["description"],
+                            entry["category"], entry["tags"], privacy=entry["privacy"])
+
+    @staticmethod
+    def _finish_job(entry):
+        # The album's job is only complete once its video is on YouTube
+        job = AlbumJob.load(entry["job_dir"])
+        job.complete('upload', {'video_id': entry["video_id"]})
+        job.finish()
+
+    def status(self):
+        """Counts of entries by status, the queue depth and the video being uploaded."""
+        with self._condition:
+            counts = {}
+            for entry in self.entries:
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            return {"depth": len(self._pending()), "max_depth": self.max_depth, "current": self.current,
+                    **counts}
@@ -1,16 +1,40 @@
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+import json
 import os
 import pickle
+import random
+import time
+from tracing import count
+from atomicfile import write_json
 
 # Scopes required for the YouTube Data API
 SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
 
+# Upload chunk size; must be a multiple of 256 KB
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# HTTP statuses worth retrying, and network errors that usually clear up on their own
+# (OSError covers connection resets and timeouts; httplib2's own errors are added when the
+# Google client libraries are loaded)
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+RETRIABLE_EXCEPTIONS = (OSError,)
+
+# Statuses for a resumable session the server no longer knows about
+EXPIRED_SESSION_CODES = (404, 410)
+
+# Built services, keyed by token file, reused across albums
+_services = {}
+
 def get_authenticated_service(token_name='token.pickle'):
-    credentials = None
-    if os.path.exists(token_name):
+    # The Google client libraries are slow to import, so they are only loaded when needed
+    from googleapiclient.discovery import build
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
+    service, credentials = _services.get(token_name, (None, None))
+    if service is not None and credentials.valid:
+        return service
+
+    if credentials is None and os.path.exists(token_name):
         with open(token_name, 'rb') as token:
             credentials = pickle.load(token)
     if not credentials or not credentials.valid:
@@ -21,9 +45,70 @@ def get_authenticated_service(token_name='token.pickle'):
             credentials = flow.run_local_server(port=0)
         with open(token_name, 'wb') as token:
             pickle.dump(credentials, token)
-    return build('youtube', 'v3', credentials=credentials)
 
-def upload_video(youtube, file, title, description, category, tags):
+    if service is None:
+        service = build('youtube', 'v3', credentials=credentials)
+    _services[token_name] = (service, credentials)
+    return service
+
+def _load_session(state_path, file):
+    """Return the saved resumable session for file, if it still matches the file on disk."""
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'r', encoding='utf-8') as state_file:
+        state = json.load(state_file)
+    stat = os.stat(file)
+    if state.get('size') != stat.st_size or state.get('mtime') != stat.st_mtime:
+        print("Video changed since the interrupted upload; starting a new upload session.")
+        return None
+    return state
+
+def _save_session(state_path, file, request):
+    stat = os.stat(file)
+    state = {
+        'file': file,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'resumable_uri': request.resumable_uri,
+        'progress': request.resumable_progress,
+    }
+    write_json(state_path, state)
+
+def _resume_session(request, media, session):
+    """
+    Point request at a saved upload session and ask the server how many bytes it kept.
+    Returns the API response if the upload had already finished, or None. Raises HttpError
+    if the session has expired.
+    """
+    from googleapiclient.errors import HttpError
+
+    response, content = request.http.request(
+        session['resumable_uri'], method='PUT',
+        headers={'Content-Range': f"bytes */{media.size()}", 'Content-Length': '0'}
+    )
+    if response.status in (200, 201):
+        return json.loads(content)
+    if response.status != 308:
+        raise HttpError(response, content, uri=session['resumable_uri'])
+    request.resumable_uri = session['resumable_uri']
+    # A 308 without a Range header means the server kept nothing yet
+    request.resumable_progress = int(response['range'].split('-')[1]) + 1 if 'range' in response else 0
+    return None
+
+def upload_video(youtube, file, title, description, category, tags, privacy='public',
+                 chunksize=DEFAULT_CHUNK_SIZE, max_retries=10, state_path=None):
+    """
+    Upload a video in chunks and return the API response.
+
+    The resumable session URI and progress are saved to state_path (default: next to the
+    video) after every chunk, so an interrupted upload continues from the last byte the
+    server acknowledged when called again, even after a restart. Retriable HTTP errors and
+    network errors are retried with exponential backoff.
+    """
+    import httplib2
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaFileUpload
+
     body = {
         'snippet': {
             'title': title,
@@ -32,11 +117,12 @@ def upload_video(youtube, file, title, description, category, tags):
             'categoryId': category
         },
         'status': {
-            'privacyStatus': 'public'
+            'privacyStatus': privacy
         }
     }
+    state_path = state_path or f"{file}.upload.json"
 
-    media = MediaFileUpload(file, chunksize=-1, resumable=True)
+    media = MediaFileUpload(file, chunksize=chunksize, resumable=True)
     request = youtube.videos().insert(
         part='snippet,status',
         body=body,
@@ -44,11 +130,52 @@ def upload_video(youtube, file, title, description, category, tags):
     )
 
     response = None
+    session = _load_session(state_path, file)
+    if session:
+        # Ask the server how much it already has before sending anything
+        try:
+            response = _resume_session(request, media, session)
+            print(f"Resuming upload of {file} from byte {request.resumable_progress}...")
+        except HttpError as e:
+            if e.resp.status not in EXPIRED_SESSION_CODES:
+                raise
+            # Sessions expire after about a week; drop it so no retry or restart tries it again
+            print(f"Saved upload session for {file} has expired (HTTP {e.resp.status}); starting a new one.")
+            os.remove(state_path)
+
+    retries = 0
     while response is None:
-        status, response = request.next_chunk()
-        if status:
-            print(f'Uploaded {int(status.progress() * 100)}%')
+        sent = request.resumable_progress
+        count('youtube_calls')
+        try:
+            status, response = request.next_chunk()
+            count('bytes_uploaded', (media.size() if response is not None else request.resumable_progress) - sent)
+            retries = 0
+            if status:
+                _save_session(state_path, file, request)
+                print(f'Uploaded {int(status.progress() * 100)}%')
+        except HttpError as e:
+            if e.resp.status in EXPIRED_SESSION_CODES and os.path.exists(state_path):
+                # The session is gone; the next attempt starts a new one
+                os.remove(state_path)
+            if e.resp.status not in RETRIABLE_STATUS_CODES:
+                raise
+            error = f"HTTP {e.resp.status}"
+        except RETRIABLE_EXCEPTIONS + (httplib2.HttpLib2Error,) as e:
+            error = f"{e.__class__.__name__}: {e}"
+        else:
+            continue
+
+        retries += 1
+        if retries > max_retries:
+            raise Exception(f"Upload of {file} failed after {max_retries} retries ({error}).")
+        # After a failed chunk, the client library first asks the server which bytes it kept
+        delay = min(2 ** retries, 64) * random.uniform(0.5, 1.0)
+        print(f"Upload error ({error}). Retrying in {delay:.1f}s...")
+        time.sleep(delay)
 
+    if os.path.exists(state_path):
+        os.remove(state_path)
     print('Upload Complete!')
     return response
 
@@ -60,4 +187,4 @@ if __name__ == '__main__':
     category = '22'  # See https://developers.google.com/youtube/v3/docs/videoCategories/list
     tags = ['Jazz', 'lofi']
 
-    upload_video(youtube, file, title, description, category, tags)
\ No newline at end of file
+    upload_video(youtube, file, title, description, category, tags)
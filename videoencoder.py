@@ -0,0 +1,67 @@
+import os
+import subprocess
+from audiotools import probe_duration
+
+# x264 settings for the still-image clip. Only a few seconds are ever encoded, so the
+# preset mostly trades a little file size for speed.
+PRESETS = {
+    'fast': {'preset': 'ultrafast', 'crf': 30},
+    'balanced': {'preset': 'veryfast', 'crf': 26},
+    'quality': {'preset': 'medium', 'crf': 20},
+}
+
+
+def _run_ffmpeg(command, output_path):
+    result = subprocess.run(['ffmpeg', '-loglevel', 'error', '-y'] + command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed to encode {output_path}: {result.stderr.strip()}")
+
+
+def encode_still_clip(image_path, clip_path, seconds=10, fps=1, preset='balanced', threads=0):
+    """Encode a short, low frame rate H.264 clip of a single image, tuned for stills."""
+    settings = PRESETS[preset] if isinstance(preset, str) else preset
+    _run_ffmpeg([
+        '-loop', '1', '-framerate', str(fps), '-i', image_path, '-t', str(seconds),
+        # x264 needs even dimensions for yuv420p
+        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p',
+        '-c:v', 'libx264', '-tune', 'stillimage',
+        '-preset', settings['preset'], '-crf', str(settings['crf']),
+        '-threads', str(threads), clip_path,
+    ], clip_path)
+    return clip_path
+
+
+def encode_still_video(image_path, audio_path, output_path, preset='balanced', fps=1, threads=0,
+                       audio_codec='copy', audio_bitrate=None, clip_seconds=10, duration=None):
+    """
+    Build an album video from a still image and an already-encoded audio track.
+
+    Only clip_seconds of video are actually encoded; that clip is then looped with stream
+    copy for the length of the audio, and the audio is copied into the MP4 unless
+    audio_codec says otherwise. threads=0 lets ffmpeg size its thread pool to the machine.
+    duration (seconds) is probed from the audio file when not given.
+    """
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    if duration is None:
+        duration = probe_duration(audio_path)
+    clip_path = f"{os.path.splitext(output_path)[0]}_still.mp4"
+
+    try:
+        encode_still_clip(image_path, clip_path, seconds=clip_seconds, fps=fps, preset=preset, threads=threads)
+
+        command = [
+            '-stream_loop', '-1', '-i', clip_path,
+            '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0',
+            '-c:v', 'copy', '-c:a', audio_codec,
+        ]
+        if audio_bitrate:
+            command += ['-b:a', audio_bitrate]
+        # -t bounds the endless video loop; -shortest trims it to the last audio packet
+        command += ['-t', f"{duration:.3f}", '-shortest', '-movflags', '+faststart', output_path]
+        _run_ffmpeg(command, output_path)
+    finally:
+        if os.path.exists(clip_path):
+            os.remove(clip_path)
+
+    return output_path
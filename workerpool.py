@@ -0,0 +1,86 @@
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import get_context
+
+# Default number of stages of each kind that may run at once across all albums
+DEFAULT_LIMITS = {
+    'suno': 2,     # albums generating songs at the same time
+    'openai': 4,   # chat and image requests
+    'youtube': 1,  # uploads
+}
+
+
+class StageLimits:
+    """
+    Concurrency limits shared by every album job.
+
+    Network-bound stages ('suno', 'openai', 'youtube') are bounded by semaphores and run in
+    the calling thread. CPU-bound stages ('cpu': decode/combine/encode) run in a process pool
+    sized to the machine's cores, so several albums can share the CPU without oversubscribing it.
+    """
+
+    def __init__(self, limits=None, cpu_workers=None):
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.semaphores = {kind: threading.BoundedSemaphore(limit) for kind, limit in limits.items()}
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        # Spawned workers don't inherit the album threads' locks the way forked ones would
+        self._processes = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=get_context('spawn'))
+
+    def run(self, kind, func, *args, **kwargs):
+        """Run func under the limit for its kind and return its result."""
+        if kind == 'cpu':
+            return self._processes.submit(func, *args, **kwargs).result()
+        with self.semaphores[kind]:
+            return func(*args, **kwargs)
+
+    @contextmanager
+    def held(self, kind):
+        """
+        Hold a slot of a network-bound kind for the block. The block receives a release()
+        that gives the slot back early, e.g. once an album's clips are generated and only
+        their downloads are left.
+        """
+        semaphore = self.semaphores[kind]
+        semaphore.acquire()
+        holding = True
+
+        def release():
+            nonlocal holding
+            if holding:
+                holding = False
+                semaphore.release()
+
+        try:
+            yield release
+        finally:
+            release()
+
+    def shutdown(self):
+        self._processes.shutdown()
+
+
+def run_albums(album_func, album_specs, max_albums=2, limits=None):
+    """
+    Produce several albums at once, each in its own job workspace.
+
+    album_func is called as album_func(*spec, limits=limits) for every spec on a pool of
+    max_albums threads. Returns a list of (spec, error) for albums that failed.
+    """
+    own_limits = limits is None
+    limits = limits or StageLimits()
+    failures = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_albums) as executor:
+            futures = {executor.submit(album_func, *spec, limits=limits): spec for spec in album_specs}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"An error occurred in album {futures[future][0]!r}: {e}")
+                    failures.append((futures[future], e))
+    finally:
+        if own_limits:
+            limits.shutdown()
+    return failures